@@ -1,10 +1,48 @@
+import codecs
 import csv
+import io
+import uuid
 from django.contrib import admin
-from django.http import HttpResponse, HttpResponseRedirect
+from django.core.exceptions import PermissionDenied
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import render
 from django.urls import path
 from django.contrib import messages
 from .models import Book
+from .importer import CatalogImporter, batched, finish_import
+
+
+EXPORT_HEADER = ['id', 'title', 'author', 'cover', 'category', 'description']
+EXPORT_FIELDS = ['id', 'title', 'author', 'cover_image', 'category', 'description']
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """A file-like object whose write() just returns the value, so csv.writer can feed a generator."""
+
+    def write(self, value):
+        return value
+
+
+def stream_books_csv(queryset):
+    """
+    Streams a queryset of books as CSV. Rows are fetched with a server-side
+    iterator over values_list tuples, so memory stays flat whatever the size.
+    """
+    writer = csv.writer(Echo())
+    rows = queryset.order_by('id').values_list(*EXPORT_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    def generate():
+        yield writer.writerow(EXPORT_HEADER)
+        # One chunk per fetch instead of one tiny chunk per row
+        for batch in batched(rows, EXPORT_CHUNK_SIZE):
+            yield ''.join(writer.writerow(row) for row in batch)
+
+    response = StreamingHttpResponse(generate(), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename=books.csv'
+    return response
 
 class BookAdmin(admin.ModelAdmin):
     list_display = ('title', 'author', 'category')
@@ -20,60 +58,78 @@ class BookAdmin(admin.ModelAdmin):
     def get_urls(self):
         urls = super().get_urls()
         custom_urls = [
-            path('upload-csv/', self.upload_csv, name='upload_csv'),
+            path('upload-csv/', self.admin_site.admin_view(self.upload_csv), name='upload_csv'),
+            path('upload-csv/errors/<uuid:token>/', self.admin_site.admin_view(self.upload_csv_errors),
+                 name='upload_csv_errors'),
+            path('export-csv/', self.admin_site.admin_view(self.export_all_csv), name='export_csv'),
         ]
         return custom_urls + urls
 
     def upload_csv(self, request):
-        """Allows the superuser to upload a CSV file and add/delete books one by one."""
+        """Imports an uploaded CSV in batched upserts and shows a single summary report."""
+        if not (self.has_add_permission(request) and self.has_change_permission(request)):
+            raise PermissionDenied
+
+        context = {**self.admin_site.each_context(request), 'opts': self.model._meta}
         if request.method == "POST":
             csv_file = request.FILES.get("csv_file")
             if not csv_file or not csv_file.name.endswith('.csv'):
                 messages.error(request, "Please upload a valid CSV file.")
                 return HttpResponseRedirect(request.path_info)
 
-            decoded_file = csv_file.read().decode('utf-8').splitlines()
-            reader = csv.DictReader(decoded_file)
-
-            for row in reader:
-                book, created = Book.objects.get_or_create(
-                    id=row["id"],
-                    defaults={
-                        "title": row["title"],
-                        "author": row["author"],
-                        "cover_image": row["cover"],
-                        "category": row["category"],
-                        "description": row["description"],
-                    },
-                )
-
-                if created:
-                    messages.success(request, f'Added: {row["title"]}')
-                else:
-                    book.title = row["title"]
-                    book.author = row["author"]
-                    book.cover_image = row["cover"]
-                    book.category = row["category"]
-                    book.description = row["description"]
-                    book.save()
-                    messages.info(request, f'Updated: {row["title"]}')
-
-            return HttpResponseRedirect(request.path_info)
-
-        return render(request, "admin/csv_upload.html")
+            # Stream the upload line by line instead of reading it into memory
+            reader = csv.DictReader(codecs.iterdecode(csv_file, 'utf-8-sig'))
+            importer = CatalogImporter(dry_run=bool(request.POST.get("dry_run")),
+                                       overwrite=bool(request.POST.get("overwrite")))
+            try:
+                report = importer.run(reader)
+            except UnicodeDecodeError:
+                messages.error(request, "The CSV file must be UTF-8 encoded.")
+                return HttpResponseRedirect(request.path_info)
 
-    def export_books_to_csv(self, request, queryset):
-        """Exports selected books to a CSV file."""
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename=books.csv'
-        writer = csv.writer(response)
-        writer.writerow(['id', 'title', 'author', 'cover', 'category', 'description'])
+            if report.errors:
+                context['error_token'] = self.save_error_file(report, reader.fieldnames or [])
+            if importer.dry_run:
+                messages.success(request, f"Dry run, nothing saved. Would import {report.summary()}")
+            else:
+                message = f"Imported {report.summary()}"
+                refreshed, written = finish_import(report)
+                if refreshed is not None:
+                    message += f" Similar books refreshed for {refreshed} books, cover thumbnails written: {written}."
+                messages.success(request, message)
+            context.update({'report': report, 'dry_run': importer.dry_run})
+
+        return render(request, "admin/csv_upload.html", context)
 
-        for book in queryset:
-            writer.writerow([book.id, book.title, book.author, book.cover_image, book.category, book.description])
+    def save_error_file(self, report, fieldnames):
+        """Writes the rejected rows to a CSV in media storage and returns its token."""
+        token = uuid.uuid4()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['line', 'error', *fieldnames])
+        for line, message, row in report.errors:
+            writer.writerow([line, message, *(row.get(name, '') for name in fieldnames)])
+        default_storage.save(f"imports/errors-{token}.csv", ContentFile(buffer.getvalue().encode('utf-8')))
+        return token
 
-        return response
+    def upload_csv_errors(self, request, token):
+        """Downloads the rejected rows of an earlier upload."""
+        name = f"imports/errors-{token}.csv"
+        if not self.has_add_permission(request) or not default_storage.exists(name):
+            raise Http404
+        return FileResponse(default_storage.open(name, 'rb'), as_attachment=True,
+                            filename=f"book-import-errors-{token}.csv")
+
+    def export_books_to_csv(self, request, queryset):
+        """Exports selected books to a CSV file."""
+        return stream_books_csv(queryset)
 
     export_books_to_csv.short_description = "Export selected books as CSV"
 
+    def export_all_csv(self, request):
+        """Exports the whole Book table to a CSV file."""
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+        return stream_books_csv(Book.objects.all())
+
 admin.site.register(Book, BookAdmin)
\ No newline at end of file
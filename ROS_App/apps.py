@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def setup_search_index(sender, using, **kwargs):
+    from django.db import connections
+    from .search import install_search_index
+
+    install_search_index(connections[using])
 
 
 class ROSAppConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "ROS_App"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        post_migrate.connect(setup_search_index, sender=self)
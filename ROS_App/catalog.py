@@ -0,0 +1,103 @@
+import os
+import threading
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DataVersion
+
+
+# DataVersion row bumped on every change to the Book table
+CATALOG_VERSION = 'catalog'
+
+
+def catalog_path():
+    return os.path.join(settings.MEDIA_ROOT, 'books.csv')
+
+
+def normalize(text):
+    """Lower-cases and collapses whitespace so lookups ignore case and spacing."""
+    return ' '.join(text.lower().split())
+
+
+def version_stamps(names):
+    """
+    {name: (token, Unix time)} for the last bump_version(name) of each name: an
+    opaque token that changes on every bump, and when that was, for
+    Last-Modified headers. Read from the database in one query, so every
+    process agrees on them.
+    """
+    stamps = dict.fromkeys(names, ('0', 0.0))
+    for name, number, changed_at in DataVersion.objects.filter(name__in=stamps).values_list(
+            'name', 'number', 'changed_at'):
+        # The time tells apart versions that reuse a number after a rollback
+        stamps[name] = f'{number}-{int(changed_at.timestamp() * 1_000_000)}', changed_at.timestamp()
+    return stamps
+
+
+def version_stamp(name):
+    """(token, Unix time) of the last bump_version(name)."""
+    return version_stamps([name])[name]
+
+
+def bump_version(name):
+    """
+    Bumps a version. Call it inside the transaction that writes the data, so
+    other processes see the new version exactly when they can see the data.
+    """
+    now = timezone.now()
+    if not connection.features.supports_update_conflicts_with_target:
+        versions = DataVersion.objects.filter(name=name)
+        if not versions.update(number=F('number') + 1, changed_at=now):
+            DataVersion.objects.bulk_create([DataVersion(name=name, changed_at=now)], ignore_conflicts=True)
+            versions.update(number=F('number') + 1, changed_at=now)
+        return
+
+    # One upsert, whether or not the row exists yet
+    table = connection.ops.quote_name(DataVersion._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (name, number, changed_at) VALUES (%s, 1, %s) '
+            f'ON CONFLICT (name) DO UPDATE SET number = {table}.number + 1, changed_at = excluded.changed_at',
+            [name, connection.ops.adapt_datetimefield_value(now)],
+        )
+
+
+def catalog_version():
+    """
+    Opaque token that changes whenever Book rows change. In-process indexes
+    built from the Book table compare it to decide when to rebuild.
+    """
+    return version_stamp(CATALOG_VERSION)[0]
+
+
+def catalog_changed():
+    """Call after writing Book rows, in the same transaction."""
+    bump_version(CATALOG_VERSION)
+
+
+class VersionedIndex:
+    """
+    Holds an in-process index built from the Book table and rebuilds it, once,
+    the first time it is asked for after one of its versions (by default just
+    the catalog's) changes.
+    """
+
+    def __init__(self, build, versions=(CATALOG_VERSION,)):
+        self._build = build
+        self._versions = versions
+        self._lock = threading.Lock()
+        self._state = None  # (version tokens, index)
+
+    def get(self):
+        stamps = version_stamps(self._versions)
+        version = tuple(stamps[name][0] for name in self._versions)
+        state = self._state
+        if state is not None and state[0] == version:
+            return state[1]
+        with self._lock:
+            if self._state is None or self._state[0] != version:
+                self._state = (version, self._build())
+            return self._state[1]
@@ -0,0 +1,253 @@
+import base64
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils._os import safe_join
+from PIL import Image, ImageOps
+
+
+# Bounding boxes for the generated covers, in pixels. "retina" is the detail
+# size at 2x; the grid size at 2x is the detail size.
+SIZES = {
+    'grid': (200, 300),
+    'detail': (400, 600),
+    'retina': (800, 1200),
+}
+
+# Pillow save options per output format, keyed by file extension
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 75, 'method': 4},
+    'jpg': {'format': 'JPEG', 'quality': 80, 'optimize': True, 'progressive': True},
+}
+
+# Cover files accepted from uploads and catalog CSVs
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif'}
+
+# Generated covers live under MEDIA_ROOT/<COVERS_DIR>/<size>/<stem>.<ext>
+COVERS_DIR = 'covers'
+
+# Each cover's pixel sizes and placeholder, as <COVERS_DIR>/info/<stem>.json
+INFO_DIR = 'info'
+
+# The placeholder shown while a cover loads: a tiny WebP inlined as a data
+# URI, a few hundred bytes, which the browser scales up (and so blurs)
+PLACEHOLDER_BOX = (12, 18)
+PLACEHOLDER_FORMAT = {'format': 'WEBP', 'quality': 40}
+
+# The width a cover is shown at, for the <img sizes> attribute, so the
+# browser can pick the smallest file that fills it
+DISPLAY_WIDTHS = {
+    'grid': '(max-width: 480px) 45vw, 200px',
+    'detail': '300px',
+    'retina': '600px',
+}
+
+
+def cover_stem(name):
+    """'books/covers/21Romeo.jpg' -> '21Romeo'"""
+    return os.path.splitext(os.path.basename(name or ''))[0]
+
+
+def variant_name(name, size, ext):
+    return f'{COVERS_DIR}/{size}/{cover_stem(name)}.{ext}'
+
+
+def variant_path(name, size, ext):
+    return os.path.join(settings.MEDIA_ROOT, variant_name(name, size, ext))
+
+
+def info_path(name):
+    return os.path.join(settings.MEDIA_ROOT, COVERS_DIR, INFO_DIR, f'{cover_stem(name)}.json')
+
+
+def source_path(name):
+    """
+    The full-size file for a cover: an upload under MEDIA_ROOT, or one of the
+    catalog covers in static/images. None if neither exists, or if the name
+    isn't an image name or would point outside those directories.
+    """
+    if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+        return None
+    candidates = []
+    if '/' in name:
+        try:
+            candidates.append(safe_join(settings.MEDIA_ROOT, name))
+        except SuspiciousFileOperation:
+            return None
+    candidates += [os.path.join(directory, 'images', os.path.basename(name)) for directory in settings.STATICFILES_DIRS]
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def is_image(path):
+    """Whether Pillow can read a file as an image."""
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        return False
+    return True
+
+
+def replace_file(path, write):
+    """Calls write(partial path), then renames the result into place, so a page never sees half a file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = f'{path}.part'
+    write(partial)
+    os.replace(partial, path)
+
+
+def placeholder(image):
+    """A data: URI of a tiny copy of an image."""
+    tiny = image.copy()
+    tiny.thumbnail(PLACEHOLDER_BOX, Image.LANCZOS)
+    buffer = BytesIO()
+    tiny.save(buffer, **PLACEHOLDER_FORMAT)
+    return 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def write_info(targets, path):
+    """
+    Records the pixel size of each generated size and the placeholder. Both
+    come from the generated JPEGs: sizes from their headers, the placeholder
+    from the smallest one, so this never decodes the full-size original.
+    """
+    dimensions = {}
+    for size in SIZES:
+        with Image.open(targets[size, 'jpg']) as image:
+            dimensions[size] = image.size
+    smallest = min(SIZES, key=lambda size: dimensions[size][0])
+    with Image.open(targets[smallest, 'jpg']) as image:
+        info = {'sizes': dimensions, 'placeholder': placeholder(image.convert('RGB'))}
+
+    def write(partial):
+        with open(partial, 'w') as file:
+            json.dump(info, file)
+    replace_file(path, write)
+
+
+def render_variants(source, targets, info, force=False):
+    """
+    Writes every (size, ext) -> path in `targets` from one source image, then
+    the cover's info file, and returns how many images were written, or None
+    if the source isn't a readable image. Up-to-date files are left alone
+    unless `force`. Runs in worker processes, so it only uses its arguments.
+    """
+    source_mtime = os.path.getmtime(source)
+    stale = {
+        key: path for key, path in targets.items()
+        if force or not os.path.exists(path) or os.path.getmtime(path) < source_mtime
+    }
+    if not stale:
+        if not os.path.exists(info) or os.path.getmtime(info) < source_mtime:
+            write_info(targets, info)
+        return 0
+
+    try:
+        with Image.open(source) as original:
+            image = ImageOps.exif_transpose(original).convert('RGB')
+    except (OSError, Image.DecompressionBombError):
+        return None
+    for (size, ext), path in stale.items():
+        thumbnail = image.copy()
+        thumbnail.thumbnail(SIZES[size], Image.LANCZOS)
+        replace_file(path, lambda partial: thumbnail.save(partial, **FORMATS[ext]))
+    write_info(targets, info)
+    return len(stale)
+
+
+def cover_job(name):
+    """(source, targets, info path) for one cover name, or None if it has no source file."""
+    source = source_path(name)
+    if source is None:
+        return None
+    targets = {(size, ext): variant_path(name, size, ext) for size in SIZES for ext in FORMATS}
+    return source, targets, info_path(name)
+
+
+def generate_cover(name, force=False):
+    """Generates the variants of one cover in this process, e.g. right after an upload."""
+    job = cover_job(name)
+    return (render_variants(*job, force=force) or 0) if job else 0
+
+
+def generate_covers(names, workers=None, force=False):
+    """
+    Generates the variants of many covers across a process pool; resizing is
+    CPU-bound, so threads wouldn't help. Returns (files written, covers that
+    have no readable image).
+    """
+    jobs = {}
+    missing = []
+    for name in sorted(set(filter(None, names))):
+        job = cover_job(name)
+        if job is None:
+            missing.append(name)
+        else:
+            jobs[name] = job
+    if not jobs:
+        return 0, missing
+
+    sources, targets, infos = zip(*jobs.values())
+    if workers == 1 or len(jobs) == 1:
+        results = map(render_variants, sources, targets, infos, [force] * len(jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(render_variants, sources, targets, infos, [force] * len(jobs), chunksize=8))
+    written = 0
+    for name, result in zip(jobs, results):
+        if result is None:
+            missing.append(name)
+        else:
+            written += result
+    return written, missing
+
+
+def delete_variants(name):
+    paths = [variant_path(name, size, ext) for size in SIZES for ext in FORMATS] + [info_path(name)]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+    _info_cache.pop(name, None)
+
+
+# name -> (info file mtime, info), so pages read each info file once per process
+_info_cache = {}
+
+
+def cover_info(name):
+    """
+    {'sizes': {size: [width, height]}, 'placeholder': data URI} for a cover
+    whose thumbnails have been generated, else None.
+    """
+    try:
+        mtime = os.stat(info_path(name)).st_mtime
+    except (OSError, ValueError):
+        return None
+    cached = _info_cache.get(name)
+    if cached is None or cached[0] != mtime:
+        try:
+            with open(info_path(name)) as file:
+                cached = (mtime, json.load(file))
+        except (OSError, ValueError):
+            return None
+        _info_cache[name] = cached
+    return cached[1]
+
+
+def original_url(name):
+    """URL of the full-size cover: a stored upload, or a catalog cover in static/images."""
+    if '/' in name and os.path.isfile(os.path.join(settings.MEDIA_ROOT, name)):
+        return settings.MEDIA_URL + name
+    return None
+
+
+def cover_url(name, size, ext):
+    """URL of a generated cover; check cover_info() first to know it exists."""
+    return settings.MEDIA_URL + variant_name(name, size, ext)
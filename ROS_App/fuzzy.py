@@ -0,0 +1,123 @@
+import re
+from array import array
+from collections import Counter
+
+from django.utils.html import escape
+
+from .catalog import VersionedIndex, normalize
+from .models import Book
+
+
+# Minimum share of the query's trigrams a title or author must contain
+SIMILARITY_THRESHOLD = 0.4
+
+# Terms scored exactly after the posting-list pass
+CANDIDATES = 200
+
+# A trigram that appears in more than this share of terms says little about a
+# match, so its posting list is skipped while gathering candidates
+COMMON_TRIGRAM_SHARE = 0.05
+
+# Target for one fuzzy lookup; `manage.py benchmark_fuzzy_search` checks it
+LATENCY_BUDGET_MS = 20
+
+
+def trigrams(text):
+    """pg_trgm-style trigrams: each word is padded with two leading spaces and one trailing."""
+    grams = set()
+    for word in re.findall(r'\w+', normalize(text)):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    """
+    In-memory trigram index over distinct book titles and author names. Each
+    trigram maps to a compact array of term numbers; a lookup counts shared
+    trigrams over the rarer posting lists, then scores the best candidates exactly.
+    """
+
+    def __init__(self, books):
+        # books: iterable of (id, title, author, cover)
+        self.books = {}
+        self.terms = []  # (display text, normalized text, 'title' or 'author', book ids)
+        term_numbers = {}
+        for book_id, title, author, cover in books:
+            self.books[book_id] = (title, author, cover)
+            for kind, text in (('title', title), ('author', author)):
+                key = (kind, normalize(text))
+                if key not in term_numbers:
+                    term_numbers[key] = len(self.terms)
+                    self.terms.append((text, key[1], kind, []))
+                self.terms[term_numbers[key]][3].append(book_id)
+
+        postings = {}
+        for number, (text, normalized, kind, ids) in enumerate(self.terms):
+            for gram in trigrams(normalized):
+                postings.setdefault(gram, array('l')).append(number)
+        self.postings = postings
+        self.common_limit = max(1000, int(len(self.terms) * COMMON_TRIGRAM_SHARE))
+
+    def __len__(self):
+        return len(self.books)
+
+    def lookup(self, query, limit=10):
+        """Returns [(score, term)] for titles and authors similar to the query, best first."""
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+
+        lists = sorted((self.postings[gram] for gram in query_grams if gram in self.postings), key=len)
+        rare = [posting for posting in lists if len(posting) <= self.common_limit]
+        counts = Counter()
+        for posting in rare if len(rare) >= 2 else lists:
+            counts.update(posting)
+
+        scored = []
+        for number, _ in counts.most_common(CANDIDATES):
+            term = self.terms[number]
+            term_grams = trigrams(term[1])
+            shared = len(query_grams & term_grams)
+            coverage = shared / len(query_grams)
+            if coverage >= SIMILARITY_THRESHOLD:
+                jaccard = shared / len(query_grams | term_grams)
+                scored.append(((coverage, jaccard), term))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored[:limit]
+
+    def search(self, query, limit=20):
+        """Returns (suggestion, books): the closest title or author and the books it ranks."""
+        matches = self.lookup(query, limit=limit)
+        if not matches:
+            return None, []
+
+        results = []
+        seen = set()
+        for _, (text, normalized, kind, ids) in matches:
+            for book_id in ids:
+                if book_id in seen:
+                    continue
+                seen.add(book_id)
+                title, author, cover = self.books[book_id]
+                results.append({
+                    'id': book_id,
+                    'title': title,
+                    'author': author,
+                    'cover': cover,
+                    'title_html': escape(title),
+                    'author_html': escape(author),
+                })
+        return matches[0][1][0], results[:limit]
+
+
+def build_fuzzy_index():
+    rows = Book.objects.values_list('id', 'title', 'author', 'cover_image').iterator(chunk_size=2000)
+    return TrigramIndex(rows)
+
+
+fuzzy_index = VersionedIndex(build_fuzzy_index)
+
+
+def fuzzy_search(query, limit=20):
+    return fuzzy_index.get().search(query, limit=limit)
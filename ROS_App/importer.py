@@ -0,0 +1,312 @@
+import time
+from itertools import islice
+
+from django.db import transaction
+
+from .catalog import catalog_changed
+from .covers import generate_covers, is_image, source_path
+from .models import Book, Category
+from .signals import release_cover
+
+
+# Book fields that are owned by the catalog CSV
+CATALOG_FIELDS = ['title', 'author', 'category', 'description', 'cover_image']
+
+DEFAULT_BATCH_SIZE = 1000
+
+UPLOAD_TO = Book._meta.get_field('cover_image').upload_to
+
+# Stored for books whose CSV row has no description
+NO_DESCRIPTION = 'no description available'
+
+# How many row-level changes a dry run keeps for display
+MAX_RECORDED_CHANGES = 500
+
+# Values a field holds when nothing was ever set, which a backfill may fill in
+BLANK_VALUES = {
+    'description': {'', NO_DESCRIPTION},
+    'cover_image': {'', Book._meta.get_field('cover_image').default},
+}
+
+
+def is_blank(name, value):
+    return value in BLANK_VALUES.get(name, {''})
+
+
+def book_fields(row):
+    """Maps a catalog CSV row onto the Book model's fields."""
+    cover = (row.get('cover') or '').strip()
+    if cover and '/' not in cover:
+        cover = f"{UPLOAD_TO}{cover}"
+    return {
+        'title': row['title'].strip(),
+        'author': row['author'].strip(),
+        'category': (row.get('category') or '').strip(),
+        'description': (row.get('description') or '').strip() or NO_DESCRIPTION,
+        'cover_image': cover or Book._meta.get_field('cover_image').default,
+    }
+
+
+def parse_row(row):
+    """Returns (book_id, fields) for a CSV row, or raises ValueError if the row is unusable."""
+    try:
+        book_id = int(row['id'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"invalid id {row.get('id')!r}")
+    if not (row.get('title') or '').strip():
+        raise ValueError("missing title")
+    if not (row.get('author') or '').strip():
+        raise ValueError("missing author")
+    return book_id, book_fields(row)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class ImportReport:
+    """Running totals for an import."""
+
+    def __init__(self):
+        self.added = 0
+        self.updated = 0
+        self.kept = 0  # existing books whose CSV values differ, but were kept rather than overwritten
+        self.unchanged = 0
+        self.failed = 0
+        self.errors = []  # (line number, message, row)
+        # (book id, 'added', 'updated' or 'kept', {field: (old, new)}): every
+        # change on dry runs, and the differing values that were kept on any run
+        self.changes = []
+        self.recorded = 0
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    @property
+    def rows(self):
+        return self.added + self.updated + self.kept + self.unchanged + self.failed
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def fail(self, line, message, row=None):
+        self.failed += 1
+        self.errors.append((line, message, row or {}))
+
+    def record_change(self, book_id, action, changes):
+        self.recorded += 1
+        if len(self.changes) < MAX_RECORDED_CHANGES:
+            self.changes.append((book_id, action, changes))
+
+    @property
+    def changes_truncated(self):
+        return self.recorded > len(self.changes)
+
+    def summary(self):
+        return (f"{self.rows} rows in {self.elapsed:.2f}s ({self.rows_per_second:.0f} rows/sec): "
+                f"{self.added} added, {self.updated} updated, {self.kept} kept, {self.unchanged} unchanged, "
+                f"{self.failed} failed.")
+
+
+class CatalogImporter:
+    """
+    Streams catalog rows into the Book table in batches. Each batch costs one
+    SELECT for the existing rows and one upsert for the new and changed ones,
+    inside its own transaction. Categories are resolved from an in-memory map
+    that is loaded once, so a row never costs a Category query.
+
+    Existing books are only backfilled: a CSV value fills a field that is
+    blank, but never replaces what an admin has set. With overwrite=True the
+    CSV wins for every field. Covers a book stops using are released.
+
+    With dry_run=True nothing is written; the report records what would change.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, dry_run=False, overwrite=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.overwrite = overwrite
+        self.report = ImportReport()
+        self._categories = None
+        self._new_categories = []
+        self._covers = {}
+        self._unstored = {}  # content name -> source path, for covers not yet copied into storage
+
+    def run(self, rows, on_batch=None):
+        """Imports an iterable of CSV dict rows (e.g. a csv.DictReader) and returns the report."""
+        # DictReader's first data row is line 2 of the file
+        numbered = enumerate(rows, start=2)
+        for batch in batched(numbered, self.batch_size):
+            self.import_batch(batch)
+            self.report.elapsed = time.monotonic() - self.report.started
+            if on_batch:
+                on_batch(self.report)
+        self.report.elapsed = time.monotonic() - self.report.started
+        return self.report
+
+    def import_batch(self, numbered_rows):
+        parsed = {}
+        for line, row in numbered_rows:
+            try:
+                book_id, fields = parse_row(row)
+            except ValueError as error:
+                self.report.fail(line, str(error), row)
+                continue
+            if book_id in parsed:
+                self.report.fail(line, f"duplicate id {book_id} in the same batch", row)
+                continue
+            try:
+                fields['cover_image'] = self.resolve_cover(fields['cover_image'])
+            except ValueError as error:
+                self.report.fail(line, str(error), row)
+                continue
+            fields['category'] = self.resolve_category(fields['category'])
+            parsed[book_id] = fields
+
+        with transaction.atomic():
+            existing = Book.objects.only(*CATALOG_FIELDS).in_bulk(list(parsed))
+            to_upsert = []
+            replaced_covers = set()
+            for book_id, fields in parsed.items():
+                db_book = existing.get(book_id)
+                if db_book is None:
+                    self.report.added += 1
+                    if self.dry_run:
+                        self.report.record_change(book_id, 'added', {
+                            name: (None, value) for name, value in fields.items()
+                        })
+                else:
+                    changed, kept = self.diff(db_book, fields, self.overwrite)
+                    if kept:
+                        self.report.record_change(book_id, 'kept', kept)
+                    if not changed:
+                        if kept:
+                            self.report.kept += 1
+                        else:
+                            self.report.unchanged += 1
+                        continue
+                    self.report.updated += 1
+                    if self.dry_run:
+                        self.report.record_change(book_id, 'updated', changed)
+                    if 'cover_image' in changed:
+                        replaced_covers.add(changed['cover_image'][0])
+                    # The upsert writes every catalog field, so keep the ones not being changed
+                    fields = {**self.current(db_book), **{name: new for name, (_, new) in changed.items()}}
+                to_upsert.append(Book(id=book_id, **fields))
+
+            if self.dry_run:
+                return
+            # Only copy in the covers that books will actually use
+            for book in to_upsert:
+                self.store_cover(book.cover_image.name)
+            if self._new_categories:
+                Category.objects.bulk_create(
+                    [Category(name=name) for name in self._new_categories],
+                    ignore_conflicts=True,
+                )
+                self._new_categories = []
+            if to_upsert:
+                Book.objects.bulk_create(
+                    to_upsert,
+                    update_conflicts=True,
+                    unique_fields=['id'],
+                    update_fields=CATALOG_FIELDS,
+                )
+                # bulk_create() sends no signals, so tell the indexes ourselves
+                catalog_changed()
+                for name in replaced_covers:
+                    release_cover(name)
+
+    def resolve_category(self, name):
+        """Maps a category name onto its existing spelling, case-insensitively."""
+        if self._categories is None:
+            names = Category.objects.values_list('name', flat=True)
+            self._categories = {existing.lower(): existing for existing in names}
+        if not name:
+            return name
+        if name.lower() not in self._categories:
+            self._categories[name.lower()] = name
+            self._new_categories.append(name)
+        return self._categories[name.lower()]
+
+    def resolve_cover(self, name):
+        """
+        Maps a CSV cover onto its content-addressed name. Re-importing the
+        same image therefore leaves the row unchanged instead of pointing it at
+        a new copy. The image is only stored once a book uses it (store_cover).
+
+        Only image files in static/images or under MEDIA_ROOT are accepted, so
+        a CSV can't publish other files on the server as covers. Raises
+        ValueError for anything else.
+        """
+        if name == Book._meta.get_field('cover_image').default:
+            return name
+        if name not in self._covers:
+            storage = Book._meta.get_field('cover_image').storage
+            source = source_path(name)
+            if source is None or not is_image(source):
+                self._covers[name] = ValueError(f"cover {name!r} is not an image in static/images or the media directory")
+            elif storage.is_content_name(name):
+                self._covers[name] = name
+            else:
+                self._covers[name] = storage.name_for_path(source, UPLOAD_TO)
+                self._unstored[self._covers[name]] = source
+        if isinstance(self._covers[name], ValueError):
+            raise self._covers[name]
+        return self._covers[name]
+
+    def store_cover(self, name):
+        """Copies a cover found by resolve_cover into storage, the first time a book uses it."""
+        source = self._unstored.pop(name, None)
+        if source is not None:
+            Book._meta.get_field('cover_image').storage.store_path(source, UPLOAD_TO)
+
+    @staticmethod
+    def current(db_book):
+        """The Book row's catalog fields, with the cover as its stored name."""
+        fields = {name: getattr(db_book, name) for name in CATALOG_FIELDS}
+        fields['cover_image'] = fields['cover_image'].name
+        return fields
+
+    @classmethod
+    def diff(cls, db_book, fields, overwrite=False):
+        """
+        Returns ({field: (old, new)}, {field: (old, new)}) for the fields whose
+        values differ from the Book row: those the CSV changes, and those kept
+        as they are. With overwrite every difference is a change; otherwise only
+        blank fields that the CSV has a value for are.
+        """
+        changed, kept = {}, {}
+        current = cls.current(db_book)
+        for name, value in fields.items():
+            if current[name] == value:
+                continue
+            if overwrite or (is_blank(name, current[name]) and not is_blank(name, value)):
+                changed[name] = (current[name], value)
+            elif not is_blank(name, value):
+                kept[name] = (current[name], value)
+        return changed, kept
+
+
+def finish_import(report, related=True, covers=True):
+    """
+    Runs what a real import needs afterwards when it added or changed books:
+    refreshes their similar-books lists and writes their cover thumbnails.
+    Returns (books refreshed, thumbnails written), None for a step not run.
+    """
+    # related imports this module, so it can't be imported at the top
+    from .related import build_related_books
+
+    refreshed = written = None
+    if report.added or report.updated:
+        if related:
+            refreshed = build_related_books()
+        if covers:
+            # Only new or replaced images get resized; the rest are up to date
+            written, _ = generate_covers(Book.objects.values_list('cover_image', flat=True).distinct())
+    return refreshed, written
@@ -0,0 +1,203 @@
+from array import array
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .catalog import bump_version, version_stamp
+from .models import Book, SkippedBooks, TBR
+
+
+# List names used by the batch API
+LISTS = {'tbr': TBR, 'skipped': SkippedBooks}
+
+OPERATIONS = ('add', 'remove', 'move')
+
+MAX_BATCH_OPERATIONS = 200
+
+# Book ids are positive 64-bit integers; anything bigger can't be bound as a query parameter
+MAX_BOOK_ID = 2 ** 63 - 1
+
+# Memberships are cached under the lists' version, so a change just stops
+# them being read; this only bounds how long the old ones linger
+MEMBERSHIP_TIMEOUT = 60 * 60
+
+
+class Membership:
+    """The ids of the books on one user's lists, as sorted arrays."""
+
+    def __init__(self, lists):
+        # lists: {list name: iterable of book ids}
+        self.lists = {name: array('l', sorted(lists.get(name, ()))) for name in LISTS}
+
+    def __contains__(self, book_id):
+        return self.status(book_id) is not None
+
+    def has(self, name, book_id):
+        ids = self.lists[name]
+        position = bisect_left(ids, book_id)
+        return position < len(ids) and ids[position] == book_id
+
+    def status(self, book_id):
+        """'tbr', 'skipped' or None for a book."""
+        for name in LISTS:
+            if self.has(name, book_id):
+                return name
+        return None
+
+
+def lists_version(user_id):
+    """Name of the DataVersion bumped whenever a user's lists change."""
+    return f'lists:{user_id}'
+
+
+def membership_key(user_id, version):
+    return f'ROS_App:lists:{user_id}:{version}'
+
+
+def get_membership(user, version=None):
+    """
+    The user's Membership, from the cache or one query per list. It is cached
+    under the lists' version token (read here unless the caller already has
+    it), so a change made by any process is seen on the next read.
+    """
+    if not user.is_authenticated:
+        return Membership({})
+    if version is None:
+        version = version_stamp(lists_version(user.id))[0]
+    membership = cache.get(membership_key(user.id, version))
+    if membership is None:
+        membership = Membership({
+            name: model.objects.filter(user_id=user.id).values_list('book_id', flat=True)
+            for name, model in LISTS.items()
+        })
+        cache.set(membership_key(user.id, version), membership, MEMBERSHIP_TIMEOUT)
+    return membership
+
+
+def request_membership(request, version=None):
+    """get_membership, loaded at most once per request."""
+    if not hasattr(request, '_list_membership'):
+        request._list_membership = get_membership(request.user, version)
+    return request._list_membership
+
+
+def membership_changed(user_id):
+    """Call after changing a user's lists, in the same transaction."""
+    bump_version(lists_version(user_id))
+
+
+def add_to_list(model, user_id, book_id):
+    """
+    Puts a book on a user's TBR or Skipped list in one INSERT that does nothing
+    if the (user, book) pair is already there. Returns True if a row was added.
+    """
+    if not connection.features.supports_update_conflicts_with_target:
+        # No ON CONFLICT clause: let the unique constraint reject duplicates
+        try:
+            with transaction.atomic():
+                model.objects.create(user_id=user_id, book_id=book_id)
+        except IntegrityError:
+            return False
+        membership_changed(user_id)
+        return True
+
+    table = connection.ops.quote_name(model._meta.db_table)
+    added_on = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (user_id, book_id, added_on) VALUES (%s, %s, %s) '
+            f'ON CONFLICT (user_id, book_id) DO NOTHING',
+            [user_id, book_id, added_on],
+        )
+        added = cursor.rowcount == 1
+    if added:
+        membership_changed(user_id)
+    return added
+
+
+def remove_from_list(model, user_id, book_id):
+    """Takes a book off a user's list. Returns True if it was there."""
+    removed, _ = model.objects.filter(user_id=user_id, book_id=book_id).delete()
+    if removed:
+        membership_changed(user_id)
+    return bool(removed)
+
+
+def check_operation(operation):
+    """Returns an error message for a malformed batch operation, or None."""
+    if not isinstance(operation, dict):
+        return 'Each operation must be an object.'
+    if operation.get('op') not in OPERATIONS:
+        return f"'op' must be one of {', '.join(OPERATIONS)}."
+    book_id = operation.get('book')
+    if not isinstance(book_id, int) or isinstance(book_id, bool) or not 1 <= book_id <= MAX_BOOK_ID:
+        return "'book' must be a book id."
+    names = ('from', 'to') if operation['op'] == 'move' else ('list',)
+    for name in names:
+        if operation.get(name) not in LISTS:
+            return f"'{name}' must be one of {', '.join(LISTS)}."
+    if operation['op'] == 'move' and operation['from'] == operation['to']:
+        return "'from' and 'to' must be different lists."
+    return None
+
+
+def apply_operations(user_id, operations):
+    """
+    Applies a batch of add/remove/move operations to a user's lists in one
+    transaction. Operations are played in order against the current lists in
+    memory, then each list gets at most one bulk INSERT and one DELETE.
+    Returns one result per operation.
+    """
+    results = [None] * len(operations)
+    valid = []
+    for number, operation in enumerate(operations):
+        error = check_operation(operation)
+        if error:
+            results[number] = {'success': False, 'message': error}
+        else:
+            valid.append((number, operation))
+
+    book_ids = {operation['book'] for _, operation in valid}
+    with transaction.atomic():
+        existing = set(Book.objects.filter(id__in=book_ids).values_list('id', flat=True))
+        before = {
+            name: set(model.objects.filter(user_id=user_id, book_id__in=existing).values_list('book_id', flat=True))
+            for name, model in LISTS.items()
+        }
+        after = {name: set(ids) for name, ids in before.items()}
+        last_touched = {}
+
+        for number, operation in valid:
+            book_id = operation['book']
+            if book_id not in existing:
+                results[number] = {'success': False, 'message': 'Book not found.'}
+                continue
+            if operation['op'] == 'add':
+                changed = book_id not in after[operation['list']]
+                after[operation['list']].add(book_id)
+            elif operation['op'] == 'remove':
+                changed = book_id in after[operation['list']]
+                after[operation['list']].discard(book_id)
+            else:
+                changed = book_id in after[operation['from']] or book_id not in after[operation['to']]
+                after[operation['from']].discard(book_id)
+                after[operation['to']].add(book_id)
+            last_touched[book_id] = number
+            results[number] = {'success': True, 'changed': changed}
+
+        if before != after:
+            membership_changed(user_id)
+        for name, model in LISTS.items():
+            removed = before[name] - after[name]
+            if removed:
+                model.objects.filter(user_id=user_id, book_id__in=removed).delete()
+            added = after[name] - before[name]
+            if added:
+                model.objects.bulk_create(
+                    # In request order, so added_on follows the order the user saved them in
+                    [model(user_id=user_id, book_id=book_id) for book_id in sorted(added, key=last_touched.get)],
+                    ignore_conflicts=True,
+                )
+    return results
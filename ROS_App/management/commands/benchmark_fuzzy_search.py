@@ -0,0 +1,56 @@
+import random
+import statistics
+import string
+import time
+
+from django.core.management.base import BaseCommand
+
+from ROS_App.fuzzy import LATENCY_BUDGET_MS, TrigramIndex
+
+
+def misspell(text, rng):
+    """Swaps two neighbouring letters, the most common typo."""
+    if len(text) < 4:
+        return text
+    i = rng.randrange(1, len(text) - 2)
+    return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+
+
+class Command(BaseCommand):
+    help = "Times fuzzy lookups against a synthetic catalog of the given size, without touching the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=100000, help="Synthetic catalog size (default: 100000)")
+        parser.add_argument('--queries', type=int, default=500, help="Misspelled queries to time (default: 500)")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        words = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10))) for _ in range(20000)]
+        authors = [' '.join(rng.choices(words, k=2)).title() for _ in range(max(1, options['books'] // 5))]
+        books = [
+            (book_id, ' '.join(rng.choices(words, k=rng.randint(1, 5))).title(), rng.choice(authors), 'cover.jpg')
+            for book_id in range(1, options['books'] + 1)
+        ]
+
+        started = time.perf_counter()
+        index = TrigramIndex(books)
+        build_seconds = time.perf_counter() - started
+
+        timings = []
+        for _ in range(options['queries']):
+            book = rng.choice(books)
+            query = misspell(book[rng.choice((1, 2))], rng)
+            started = time.perf_counter()
+            index.lookup(query)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        timings.sort()
+        p50 = statistics.median(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(f"{len(index)} books, {len(index.terms)} terms, built in {build_seconds:.2f}s")
+        self.stdout.write(f"lookup p50 {p50:.2f}ms, p95 {p95:.2f}ms, max {timings[-1]:.2f}ms")
+        if p95 <= LATENCY_BUDGET_MS:
+            self.stdout.write(self.style.SUCCESS(f"p95 within the {LATENCY_BUDGET_MS}ms budget"))
+        else:
+            self.stdout.write(self.style.WARNING(f"p95 over the {LATENCY_BUDGET_MS}ms budget"))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ROS_App.covers import generate_covers
+from ROS_App.models import Book
+
+
+class Command(BaseCommand):
+    help = ("Generates grid, detail and retina thumbnails, in WebP and JPEG, for every book cover. "
+            "Covers whose thumbnails are already up to date are skipped.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Worker processes (default: one per CPU)")
+        parser.add_argument('--force', action='store_true', help="Regenerate up-to-date thumbnails too")
+
+    def handle(self, *args, **options):
+        if options['workers'] is not None and options['workers'] < 1:
+            raise CommandError("--workers must be at least 1.")
+        names = Book.objects.values_list('cover_image', flat=True).distinct()
+        written, missing = generate_covers(names, workers=options['workers'], force=options['force'])
+        for name in missing:
+            self.stderr.write(f"No image file for cover {name}")
+        self.stdout.write(self.style.SUCCESS(f"Cover thumbnails written: {written}."))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ROS_App.recommender import NEIGHBOURS, RECOMMENDATIONS, build_recommendations
+
+
+class Command(BaseCommand):
+    help = ("Rebuilds the similar-books and per-user recommendation tables from TBR, Skipped and "
+            "review feedback. By default only books and users with new feedback are refreshed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Recompute every book and user")
+        parser.add_argument('--neighbours', type=int, default=NEIGHBOURS,
+                            help=f"Similar books kept per book (default: {NEIGHBOURS})")
+        parser.add_argument('--per-user', type=int, default=RECOMMENDATIONS,
+                            help=f"Recommendations kept per user (default: {RECOMMENDATIONS})")
+
+    def handle(self, *args, **options):
+        if options['neighbours'] < 1 or options['per_user'] < 1:
+            raise CommandError("--neighbours and --per-user must be at least 1.")
+        books, users = build_recommendations(full=options['full'], k=options['neighbours'], n=options['per_user'])
+        self.stdout.write(self.style.SUCCESS(f"Recommendations refreshed for {books} books and {users} users."))
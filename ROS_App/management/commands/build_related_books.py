@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ROS_App.related import NEIGHBOURS, build_related_books
+
+
+class Command(BaseCommand):
+    help = ("Rebuilds the \"similar books\" lists from description TF-IDF. By default only books "
+            "whose description changed since the last run, and the lists they affect, are redone.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Recompute every book")
+        parser.add_argument('--neighbours', type=int, default=NEIGHBOURS,
+                            help=f"Similar books kept per book (default: {NEIGHBOURS})")
+
+    def handle(self, *args, **options):
+        if options['neighbours'] < 1:
+            raise CommandError("--neighbours must be at least 1.")
+        refreshed = build_related_books(full=options['full'], k=options['neighbours'])
+        self.stdout.write(self.style.SUCCESS(f"Similar books refreshed for {refreshed} books."))
@@ -0,0 +1,74 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ROS_App.catalog import catalog_changed
+from ROS_App.covers import COVERS_DIR, cover_stem, generate_covers
+from ROS_App.importer import UPLOAD_TO
+from ROS_App.models import Book
+
+
+class Command(BaseCommand):
+    help = ("Moves every uploaded cover into content-addressed storage, points books at the single "
+            "stored copy, then deletes uploads and thumbnails that no book uses any more.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report what would happen without changing anything")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        storage = Book._meta.get_field('cover_image').storage
+
+        # 1. Re-point books at content-addressed copies of their covers
+        moved = {}
+        for name in Book.objects.values_list('cover_image', flat=True).distinct():
+            if not name or storage.is_content_name(name) or not storage.exists(name):
+                continue
+            if dry_run:
+                stored = storage.name_for_path(storage.path(name), UPLOAD_TO)
+            else:
+                stored = storage.store_path(storage.path(name), UPLOAD_TO)
+                Book.objects.filter(cover_image=name).update(cover_image=stored)
+            moved[name] = stored
+            if options['verbosity'] >= 2:
+                self.stdout.write(f"  {name} -> {stored}")
+        if moved and not dry_run:
+            # update() sends no signals
+            catalog_changed()
+            # Thumbnails are named after the cover, so the moved ones need their
+            # own before step 2 deletes the variants of the old names
+            written, _ = generate_covers(moved.values())
+            if options['verbosity'] >= 2:
+                self.stdout.write(f"  {written} thumbnails written for the moved covers")
+
+        # 2. Collect uploads and thumbnails nothing refers to
+        used = {moved.get(name, name) for name in Book.objects.values_list('cover_image', flat=True)}
+        used_stems = {cover_stem(name) for name in used}
+
+        garbage = []
+        uploads = os.path.join(settings.MEDIA_ROOT, UPLOAD_TO)
+        for directory, _, files in os.walk(uploads):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+                if name not in used:
+                    garbage.append(path)
+        thumbnails = os.path.join(settings.MEDIA_ROOT, COVERS_DIR)
+        for directory, _, files in os.walk(thumbnails):
+            garbage += [os.path.join(directory, filename) for filename in files
+                        if cover_stem(filename) not in used_stems]
+
+        freed = sum(os.path.getsize(path) for path in garbage)
+        if not dry_run:
+            for path in garbage:
+                os.remove(path)
+            for directory, _, _ in os.walk(uploads, topdown=False):
+                if directory != uploads and not os.listdir(directory):
+                    os.rmdir(directory)
+
+        moved_verb, deleted_verb = ('Would move', 'would delete') if dry_run else ('Moved', 'deleted')
+        self.stdout.write(self.style.SUCCESS(
+            f"{moved_verb} {len(moved)} covers to content-addressed storage; "
+            f"{deleted_verb} {len(garbage)} unused files ({freed / 1024 / 1024:.1f} MB)."
+        ))
@@ -0,0 +1,66 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ROS_App.catalog import catalog_path
+from ROS_App.importer import CatalogImporter, DEFAULT_BATCH_SIZE, finish_import
+
+
+class Command(BaseCommand):
+    help = ("Streams a books CSV (id,title,author,cover,category,description) into the Book table "
+            "in batched upserts. Defaults to media/books.csv.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', nargs='?', help="CSV file to import (default: media/books.csv)")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help=f"Rows per transaction (default: {DEFAULT_BATCH_SIZE})")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Report what would change without writing anything")
+        parser.add_argument('--overwrite', action='store_true',
+                            help="Replace fields of existing books with the CSV's values "
+                                 "(by default only blank fields are filled in)")
+        parser.add_argument('--skip-related', action='store_true',
+                            help="Don't refresh the similar-books lists of changed books afterwards")
+        parser.add_argument('--skip-covers', action='store_true',
+                            help="Don't generate cover thumbnails afterwards")
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        path = options['csv_path'] or catalog_path()
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        importer = CatalogImporter(batch_size=options['batch_size'], dry_run=options['dry_run'],
+                                   overwrite=options['overwrite'])
+        try:
+            with open(path, newline='', encoding='utf-8-sig') as csv_file:
+                report = importer.run(csv.DictReader(csv_file), on_batch=self.progress)
+        except FileNotFoundError:
+            raise CommandError(f"No such file: {path}")
+
+        for line, message, row in report.errors[:20]:
+            self.stderr.write(f"line {line}: {message}")
+        if len(report.errors) > 20:
+            self.stderr.write(f"... and {len(report.errors) - 20} more errors")
+        # Dry runs list every change; real runs the values kept instead of overwritten
+        for book_id, action, changes in report.changes:
+            self.stdout.write(f"  {action} {book_id}: {', '.join(changes)}")
+        if report.changes_truncated:
+            self.stdout.write(f"  ... only the first {len(report.changes)} are listed")
+        if report.kept:
+            self.stdout.write(self.style.WARNING(
+                f"{report.kept} existing books differ from the CSV and were kept; use --overwrite to replace them."))
+        if importer.dry_run:
+            self.stdout.write(self.style.WARNING(f"Dry run, nothing written. Would import {report.summary()}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Imported {report.summary()}"))
+            refreshed, written = finish_import(report, related=not options['skip_related'],
+                                               covers=not options['skip_covers'])
+            if refreshed is not None:
+                self.stdout.write(f"Similar books refreshed for {refreshed} books.")
+            if written is not None:
+                self.stdout.write(f"Cover thumbnails written: {written}.")
+
+    def progress(self, report):
+        if self.verbosity >= 2:
+            self.stdout.write(f"  {report.rows} rows ({report.rows_per_second:.0f} rows/sec)")
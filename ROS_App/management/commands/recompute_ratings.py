@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ROS_App.ratings import recompute_ratings
+
+
+class Command(BaseCommand):
+    help = "Recomputes every book's rating count, sum, average and star histogram from its reviews."
+
+    def handle(self, *args, **options):
+        fixed = recompute_ratings()
+        self.stdout.write(self.style.SUCCESS(f"Rating aggregates recomputed: {fixed} books corrected."))
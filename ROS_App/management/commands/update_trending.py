@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from ROS_App.trending import update_trending
+
+
+class Command(BaseCommand):
+    help = ("Adds recent TBR adds, skips and reviews to each book's time-decayed popularity score. "
+            "Run it on a schedule, e.g. every 15 minutes.")
+
+    def handle(self, *args, **options):
+        changed = update_trending()
+        self.stdout.write(self.style.SUCCESS(f"Trending scores updated for {changed} books."))
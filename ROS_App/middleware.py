@@ -0,0 +1,93 @@
+import mimetypes
+import os
+import posixpath
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+
+# Hashed names never change contents, so browsers may keep them for a year
+# without asking again
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Plain names can change on the next deploy, so browsers revalidate them
+REVALIDATE_CACHE_CONTROL = 'public, max-age=0, must-revalidate'
+
+
+def accepts_gzip(request):
+    """Whether the Accept-Encoding header allows gzip, e.g. 'gzip, deflate, br'."""
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = part.partition(';')
+        if coding.strip().lower() not in ('gzip', '*'):
+            continue
+        quality = params.strip().lower()
+        if quality.startswith('q='):
+            try:
+                return float(quality[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+class StaticFilesMiddleware:
+    """
+    Serves files collected into STATIC_ROOT before sessions, auth and the
+    URLconf get involved. Hashed names are sent as immutable; a gzipped copy
+    written by collectstatic is sent instead of the file to clients that
+    accept it. In development runserver serves /static/ itself, ahead of this.
+    """
+
+    def __init__(self, get_response):
+        if not settings.STATIC_ROOT or not settings.STATIC_URL.startswith('/'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL
+        self.immutable = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and request.path_info.startswith(self.prefix):
+            response = self.serve(request, request.path_info[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def serve(self, request, name):
+        """A response for a collected file, or None if there isn't one."""
+        name = posixpath.normpath(name).lstrip('/')
+        try:
+            path = safe_join(settings.STATIC_ROOT, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        content_type, _ = mimetypes.guess_type(path)
+        compressed = os.path.isfile(f'{path}.gz')
+        encoding = 'gzip' if compressed and accepts_gzip(request) else None
+        served = f'{path}.gz' if encoding else path
+        stat = os.stat(served)
+
+        if name in self.immutable:
+            cache_control = IMMUTABLE_CACHE_CONTROL
+        else:
+            cache_control = REVALIDATE_CACHE_CONTROL
+            if not was_modified_since(request.headers.get('If-Modified-Since'), stat.st_mtime):
+                response = HttpResponseNotModified()
+                response['Cache-Control'] = cache_control
+                return response
+
+        response = FileResponse(open(served, 'rb'), content_type=content_type or 'application/octet-stream',
+                                filename=os.path.basename(path))
+        response['Cache-Control'] = cache_control
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        if compressed:
+            response['Vary'] = 'Accept-Encoding'
+        if encoding:
+            response['Content-Encoding'] = encoding
+        return response
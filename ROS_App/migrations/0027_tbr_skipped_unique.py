@@ -0,0 +1,41 @@
+# Generated by Django 5.1.15 on 2026-10-18 14:31
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicates(apps, schema_editor):
+    # Keep the first entry of every (user, book) pair; one DELETE per table
+    for name in ('TBR', 'SkippedBooks'):
+        model = apps.get_model('ROS_App', name)
+        first = model.objects.values('user_id', 'book_id').annotate(first=Min('id')).values('first')
+        model.objects.exclude(id__in=first).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ROS_App', '0026_review_feed_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='skippedbooks',
+            index=models.Index(fields=['user', '-added_on', '-id'], name='skipped_user_added_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tbr',
+            index=models.Index(fields=['user', '-added_on', '-id'], name='tbr_user_added_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='skippedbooks',
+            constraint=models.UniqueConstraint(fields=('user', 'book'), name='skipped_unique_user_book'),
+        ),
+        migrations.AddConstraint(
+            model_name='tbr',
+            constraint=models.UniqueConstraint(fields=('user', 'book'), name='tbr_unique_user_book'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.15 on 2026-10-18 14:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ROS_App', '0027_tbr_skipped_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-popularity_score', 'id'], name='book_popular_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.15 on 2026-10-18 14:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ROS_App', '0029_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('landmark', models.DateTimeField()),
+                ('updated_until', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.15 on 2026-10-18 14:52
+
+import ROS_App.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ROS_App', '0031_related_books'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='cover_image',
+            field=models.ImageField(default='images/dracula.jpg', storage=ROS_App.storage.cover_storage, upload_to='books/covers/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ROS_App', '0032_cover_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='reviews_changed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+from .storage import cover_storage
+
 class Category(models.Model):
     name = models.CharField(max_length=200, unique=True)
 
@@ -12,25 +14,73 @@ class Book(models.Model):
     title = models.CharField(max_length=200)
     author = models.CharField(max_length=200)
     description = models.TextField(blank=True, null=True)
-    cover_image = models.ImageField(upload_to='books/covers/', default='images/dracula.jpg')
+    # Stored once per distinct image, under its content hash
+    cover_image = models.ImageField(upload_to='books/covers/', default='images/dracula.jpg', storage=cover_storage)
     popularity_score = models.FloatField(default=0) 
     category = models.CharField(max_length=100, blank=True, null=True)
+
+    # Review aggregates, kept up to date by ROS_App.ratings so pages never
+    # have to aggregate over reviews. `manage.py recompute_ratings` repairs them.
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_average = models.FloatField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+    # When a review of the book was last added, edited or deleted, for the
+    # book page's Last-Modified header
+    reviews_changed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # One index per category listing sort, so every page is a range scan
+        indexes = [
+            models.Index(fields=['category', 'title', 'id'], name='book_category_title_idx'),
+            models.Index(fields=['category', '-popularity_score', 'id'], name='book_category_popular_idx'),
+            models.Index(fields=['category', '-rating_average', 'id'], name='book_category_rating_idx'),
+            # The read-or-skip queue across all categories
+            models.Index(fields=['-popularity_score', 'id'], name='book_popular_idx'),
+        ]
    
     def __str__(self):
         return self.title
 
+    @property
+    def rating_histogram(self):
+        """(stars, count) pairs from 5 stars down to 1."""
+        return [(stars, getattr(self, f'rating_{stars}')) for stars in range(5, 0, -1)]
+
 # Model for TBR (To Be Read)
 class TBR(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
     added_on = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # A book is on a user's list at most once; lists page by added_on
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'book'], name='tbr_unique_user_book'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-added_on', '-id'], name='tbr_user_added_idx'),
+        ]
+
 # Model for SkippedBooks
 class SkippedBooks(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
     added_on = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # A book is on a user's list at most once; lists page by added_on
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'book'], name='skipped_unique_user_book'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-added_on', '-id'], name='skipped_user_added_idx'),
+        ]
+
 
 # Model for Reviews
 class Review(models.Model):
@@ -41,5 +91,74 @@ class Review(models.Model):
     rating = models.IntegerField()  # A simple rating from 1-5
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Backs the newest-first review feed on the book pages
+        indexes = [
+            models.Index(fields=['book', '-created_at', '-id'], name='review_book_feed_idx'),
+        ]
+
     def __str__(self):
         return f"Review by {self.user.username} on {self.book.title}"
+
+
+# Precomputed by ROS_App.recommender (`manage.py build_recommendations`), so
+# serving either list is a single indexed lookup
+class SimilarBook(models.Model):
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='similar_books')
+    similar = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    computed_on = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'rank'], name='similar_book_rank_unique'),
+        ]
+
+
+class Recommendation(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendations')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    computed_on = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'rank'], name='recommendation_user_rank_unique'),
+        ]
+
+
+# Change counters for data that processes build caches and HTTP validators
+# from, one row per kind of data (see ROS_App.catalog.bump_version). Kept in
+# the database so every web worker and management command sees the same one.
+class DataVersion(models.Model):
+    name = models.CharField(max_length=100, primary_key=True)
+    number = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField()
+
+
+# Bookkeeping for ROS_App.trending: one row. Book.popularity_score holds
+# trend scores decayed to `landmark`; `updated_until` is the newest event counted.
+class TrendingState(models.Model):
+    landmark = models.DateTimeField()
+    updated_until = models.DateTimeField()
+
+
+# Built from description TF-IDF by ROS_App.related (`manage.py build_related_books`)
+class RelatedBook(models.Model):
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='related_books')
+    related = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'rank'], name='related_book_rank_unique'),
+        ]
+
+
+# The description each book's RelatedBook rows were last computed from
+class DescriptionDigest(models.Model):
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    digest = models.CharField(max_length=40)
@@ -0,0 +1,94 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+def cursor_value(value):
+    # Full-precision isoformat: DjangoJSONEncoder would cut datetimes to
+    # milliseconds and the keyset comparison would skip or repeat rows
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Can't put {type(value).__name__} in a cursor")
+
+
+def encode_cursor(values):
+    data = json.dumps(values, default=cursor_value, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, length):
+    """Returns the list of values in a cursor, or None if it is missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        return None
+    if not isinstance(values, list) or len(values) != length:
+        return None
+    return values
+
+
+def after(ordering, values):
+    """
+    Builds the keyset condition "comes after this row" for an ordering such as
+    ['-popularity_score', 'id']: (a > x) OR (a = x AND b > y) OR ..., with the
+    comparison flipped for descending fields.
+    """
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+def field_value(obj, path):
+    """Follows a lookup path such as 'book__title' through related objects."""
+    for name in path.split('__'):
+        obj = getattr(obj, name)
+    return obj
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def keyset_page(queryset, ordering, cursor=None, per_page=24):
+    """
+    Fetches the page that follows `cursor`. Unlike OFFSET pagination every page
+    is one index range scan, so page 1000 costs the same as page 1. The last
+    field of `ordering` must be unique (normally 'id') so ties are stable.
+    """
+    values = decode_cursor(cursor, len(ordering))
+    if values is not None:
+        try:
+            queryset = queryset.filter(after(ordering, values))
+        except (ValidationError, ValueError, TypeError):
+            pass  # a cursor with values of the wrong type starts from the top
+    rows = list(queryset.order_by(*ordering)[:per_page + 1])
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor([field_value(last, field.lstrip('-')) for field in ordering])
+    return KeysetPage(rows, next_cursor)
@@ -0,0 +1,82 @@
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Q, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.utils import timezone
+
+from .catalog import bump_version
+from .models import Book, Review
+
+
+STARS = range(1, 6)
+RATING_FIELDS = ['rating_count', 'rating_sum', 'rating_average'] + [f'rating_{stars}' for stars in STARS]
+
+# DataVersion row bumped whenever any book's rating aggregates change
+RATINGS_VERSION = 'ratings'
+
+
+def update_ratings(book_id, rating, delta):
+    """
+    Adds (delta=1) or removes (delta=-1) one rating from a book's aggregates.
+    It is a single UPDATE built from F() expressions, so concurrent reviews
+    can't overwrite each other's counts.
+    """
+    rating = int(rating)
+    changes = {
+        'rating_count': F('rating_count') + delta,
+        'rating_sum': F('rating_sum') + delta * rating,
+        # The right-hand side sees the old values, so apply the delta here too
+        'rating_average': Coalesce(
+            Cast(F('rating_sum') + delta * rating, FloatField()) / NullIf(F('rating_count') + delta, 0),
+            0.0,
+        ),
+    }
+    if rating in STARS:
+        changes[f'rating_{rating}'] = F(f'rating_{rating}') + delta
+    Book.objects.filter(id=book_id).update(reviews_changed_at=timezone.now(), **changes)
+    bump_version(RATINGS_VERSION)
+
+
+def reviews_changed(book_id):
+    """Marks a book's reviews as changed when its ratings didn't, e.g. a reworded review."""
+    Book.objects.filter(id=book_id).update(reviews_changed_at=timezone.now())
+
+
+def grouped_ratings():
+    """Every book's aggregates from one grouped query over reviews."""
+    rows = Review.objects.values('book_id').annotate(
+        count=Count('id'),
+        total=Sum('rating'),
+        **{f'stars_{stars}': Count('id', filter=Q(rating=stars)) for stars in STARS},
+    )
+    ratings = {}
+    for row in rows:
+        values = {
+            'rating_count': row['count'],
+            'rating_sum': row['total'],
+            'rating_average': row['total'] / row['count'],
+        }
+        values.update({f'rating_{stars}': row[f'stars_{stars}'] for stars in STARS})
+        ratings[row['book_id']] = values
+    return ratings
+
+
+def recompute_ratings(batch_size=1000):
+    """Rebuilds every book's aggregates from the reviews. Returns the number of books fixed."""
+    ratings = grouped_ratings()
+    empty = dict.fromkeys(RATING_FIELDS, 0)
+    now = timezone.now()
+    with transaction.atomic():
+        # Collect first: SQLite gives no isolation between a running SELECT
+        # and writes to the same table on one connection
+        stale = []
+        for book in Book.objects.only(*RATING_FIELDS).iterator(chunk_size=batch_size):
+            values = ratings.get(book.id, empty)
+            if any(getattr(book, name) != value for name, value in values.items()):
+                for name, value in values.items():
+                    setattr(book, name, value)
+                book.reviews_changed_at = now
+                stale.append(book)
+        Book.objects.bulk_update(stale, RATING_FIELDS + ['reviews_changed_at'], batch_size=batch_size)
+        if stale:
+            bump_version(RATINGS_VERSION)
+    return len(stale)
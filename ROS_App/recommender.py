@@ -0,0 +1,220 @@
+import numpy as np
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .importer import batched
+from .models import Recommendation, Review, SimilarBook, SkippedBooks, TBR
+
+
+# Implicit feedback: saving a book counts as liking it, skipping as disliking
+# it. A review replaces both, from -1 for one star to +1 for five.
+TBR_WEIGHT = 1.0
+SKIP_WEIGHT = -1.0
+
+# Similar books kept per book, and recommendations kept per user
+NEIGHBOURS = 20
+RECOMMENDATIONS = 50
+
+# Damps similarities that rest on only a few shared readers
+SHRINKAGE = 5
+
+WRITE_BATCH_SIZE = 500
+
+
+def review_weight(rating):
+    return (rating - 3) / 2
+
+
+class Interactions:
+    """
+    A sparse user x book matrix of signed feedback, stored both row-wise
+    (per user) and column-wise (per book) as CSR-style arrays.
+    """
+
+    def __init__(self, user_ids, book_ids, weights):
+        users, rows = np.unique(np.asarray(user_ids, dtype=np.int64), return_inverse=True)
+        books, cols = np.unique(np.asarray(book_ids, dtype=np.int64), return_inverse=True)
+        weights = np.asarray(weights, dtype=np.float64)
+        self.users = users
+        self.books = books
+        self.user_ptr, self.user_books, self.user_weights = compress(rows, cols, weights, len(users))
+        self.book_ptr, self.book_users, self.book_weights = compress(cols, rows, weights, len(books))
+        self.norms = np.sqrt(np.bincount(cols, weights=weights ** 2, minlength=len(books)))
+
+    def user_row(self, user):
+        start, stop = self.user_ptr[user], self.user_ptr[user + 1]
+        return self.user_books[start:stop], self.user_weights[start:stop]
+
+    def similar(self, book, k=NEIGHBOURS):
+        """(book numbers, scores) of the k books most similar to `book`, best first."""
+        start, stop = self.book_ptr[book], self.book_ptr[book + 1]
+        readers, reader_weights = self.book_users[start:stop], self.book_weights[start:stop]
+        if not len(readers) or not self.norms[book]:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        # Every (other book, weight product) over the readers of this book
+        positions, lengths = spans(self.user_ptr, readers)
+        others = self.user_books[positions]
+        products = self.user_weights[positions] * np.repeat(reader_weights, lengths)
+
+        others, inverse = np.unique(others, return_inverse=True)
+        dots = np.bincount(inverse, weights=products)
+        shared = np.bincount(inverse)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = dots / (self.norms[book] * self.norms[others]) * shared / (shared + SHRINKAGE)
+
+        keep = (others != book) & (scores > 0)
+        return top_k(others[keep], scores[keep], k)
+
+
+def compress(rows, cols, values, size):
+    """CSR arrays (pointers, column numbers, values) for the given coordinates."""
+    order = np.lexsort((cols, rows))
+    pointers = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=size), out=pointers[1:])
+    return pointers, cols[order], values[order]
+
+
+def spans(pointers, rows):
+    """Positions of every entry in the given CSR rows, and each row's length."""
+    starts = pointers[rows]
+    lengths = pointers[rows + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(lengths.sum()), lengths
+
+
+def top_k(items, scores, k):
+    if len(items) > k:
+        best = np.argpartition(-scores, k)[:k]
+        items, scores = items[best], scores[best]
+    order = np.argsort(-scores, kind='stable')
+    return items[order], scores[order]
+
+
+def load_interactions():
+    """Interactions from every TBR, Skipped and Review row."""
+    signals = {}
+    for user_id, book_id in TBR.objects.values_list('user_id', 'book_id').iterator(chunk_size=5000):
+        signals[user_id, book_id] = TBR_WEIGHT
+    for user_id, book_id in SkippedBooks.objects.values_list('user_id', 'book_id').iterator(chunk_size=5000):
+        signals[user_id, book_id] = SKIP_WEIGHT
+    for user_id, book_id, rating in Review.objects.values_list('user_id', 'book_id', 'rating').iterator(chunk_size=5000):
+        signals[user_id, book_id] = review_weight(rating)
+
+    signals = {key: weight for key, weight in signals.items() if weight}
+    user_ids = [user_id for user_id, _ in signals]
+    book_ids = [book_id for _, book_id in signals]
+    return Interactions(user_ids, book_ids, list(signals.values()))
+
+
+def recommend(interactions, neighbours, scores, user, n=RECOMMENDATIONS):
+    """
+    (book numbers, scores) for one user: the similar-book lists of everything
+    they have rated, weighted by their feedback, minus the books they already know.
+    """
+    books, weights = interactions.user_row(user)
+    candidates = neighbours[books].ravel()
+    contributions = (scores[books] * weights[:, None]).ravel()
+    known = np.isin(candidates, books)
+    keep = (candidates >= 0) & ~known
+    candidates, inverse = np.unique(candidates[keep], return_inverse=True)
+    totals = np.bincount(inverse, weights=contributions[keep])
+    positive = totals > 0
+    return top_k(candidates[positive], totals[positive], n)
+
+
+def changed_since(since):
+    """Users with feedback newer than `since`, and the books it was about."""
+    users, books = set(), set()
+    for model, field in ((TBR, 'added_on'), (SkippedBooks, 'added_on'), (Review, 'created_at')):
+        rows = model.objects.filter(**{f'{field}__gt': since}).values_list('user_id', 'book_id')
+        for user_id, book_id in rows.iterator(chunk_size=5000):
+            users.add(user_id)
+            books.add(book_id)
+    return users, books
+
+
+def last_build():
+    return SimilarBook.objects.aggregate(last=Max('computed_on'))['last']
+
+
+def build_recommendations(full=False, k=NEIGHBOURS, n=RECOMMENDATIONS):
+    """
+    Recomputes the SimilarBook and Recommendation tables. An incremental run
+    redoes the books with feedback added since the last run, every other book
+    the users who gave it have feedback on (their similarity to those books
+    changed), and the books whose list names a changed book; then the
+    recommendations of everyone with feedback on any of them. Removals, edited
+    ratings, and books that could only now join a list of a book the new
+    feedback's users never rated are picked up by the next full run, so
+    schedule one regularly. Returns (books refreshed, users refreshed).
+    """
+    since = None if full else last_build()
+    now = timezone.now()
+    interactions = load_interactions()
+    numbers = {book_id: number for number, book_id in enumerate(interactions.books.tolist())}
+    user_numbers = {user_id: number for number, user_id in enumerate(interactions.users.tolist())}
+
+    if since is None:
+        book_numbers = range(len(interactions.books))
+        user_ids = set(interactions.users.tolist())
+    else:
+        user_ids, book_ids = changed_since(since)
+        dirty = {numbers[book_id] for book_id in book_ids if book_id in numbers}
+        # Books co-rated by the users with new feedback
+        users = np.array([user_numbers[user_id] for user_id in user_ids if user_id in user_numbers], dtype=np.int64)
+        positions, _ = spans(interactions.user_ptr, users)
+        dirty.update(interactions.user_books[positions].tolist())
+        listing = SimilarBook.objects.filter(similar_id__in=book_ids).values_list('book_id', flat=True).distinct()
+        dirty.update(numbers[book_id] for book_id in listing if book_id in numbers)
+        book_numbers = sorted(dirty)
+        # Everyone with feedback on a refreshed book gets recommendations from its new list
+        positions, _ = spans(interactions.book_ptr, np.array(book_numbers, dtype=np.int64))
+        user_ids |= set(interactions.users[interactions.book_users[positions]].tolist())
+
+    refreshed_books = 0
+    for chunk in batched(book_numbers, WRITE_BATCH_SIZE):
+        rows = []
+        for book in chunk:
+            similar, similar_scores = interactions.similar(book, k)
+            book_id = int(interactions.books[book])
+            rows += [
+                SimilarBook(book_id=book_id, similar_id=int(interactions.books[other]), score=float(score),
+                            rank=rank, computed_on=now)
+                for rank, (other, score) in enumerate(zip(similar, similar_scores))
+            ]
+        with transaction.atomic():
+            SimilarBook.objects.filter(book_id__in=interactions.books[list(chunk)].tolist()).delete()
+            SimilarBook.objects.bulk_create(rows, batch_size=WRITE_BATCH_SIZE)
+        refreshed_books += len(chunk)
+    if full:
+        # Books nobody has feedback on any more
+        SimilarBook.objects.exclude(computed_on=now).delete()
+
+    # Neighbour table for scoring: row per book number, padded with -1
+    neighbours = np.full((len(interactions.books), k), -1, dtype=np.int64)
+    scores = np.zeros((len(interactions.books), k))
+    for book_id, similar_id, rank, score in SimilarBook.objects.filter(rank__lt=k).values_list(
+            'book_id', 'similar_id', 'rank', 'score').iterator(chunk_size=5000):
+        if book_id in numbers and similar_id in numbers:
+            neighbours[numbers[book_id], rank] = numbers[similar_id]
+            scores[numbers[book_id], rank] = score
+
+    for chunk in batched(sorted(user_ids), WRITE_BATCH_SIZE):
+        rows = []
+        for user_id in chunk:
+            if user_id not in user_numbers:
+                continue
+            books, book_scores = recommend(interactions, neighbours, scores, user_numbers[user_id], n)
+            rows += [
+                Recommendation(user_id=user_id, book_id=int(interactions.books[book]), score=float(score),
+                               rank=rank, computed_on=now)
+                for rank, (book, score) in enumerate(zip(books, book_scores))
+            ]
+        with transaction.atomic():
+            Recommendation.objects.filter(user_id__in=chunk).delete()
+            Recommendation.objects.bulk_create(rows, batch_size=WRITE_BATCH_SIZE)
+    if full:
+        Recommendation.objects.exclude(computed_on=now).delete()
+    return refreshed_books, len(user_ids)
@@ -0,0 +1,236 @@
+import hashlib
+import math
+import re
+from collections import Counter
+
+import numpy as np
+from django.db import transaction
+
+from .catalog import bump_version
+from .importer import NO_DESCRIPTION, batched
+from .models import Book, DescriptionDigest, RelatedBook
+from .recommender import top_k
+
+
+# Related books kept per book
+NEIGHBOURS = 10
+
+# Words in fewer books than this, or in more than this share of them, say
+# nothing about how alike two books are
+MIN_DOCUMENT_FREQUENCY = 2
+MAX_DOCUMENT_SHARE = 0.5
+
+# Each book is compared on its highest-weighted words only, and through each
+# word on the TERM_POSTINGS books that weigh it most, which bounds the work per
+# book whatever the length of its description or the size of the catalog
+QUERY_TERMS = 32
+TERM_POSTINGS = 256
+
+# A block of books is scored against the catalog in one go, with one entry
+# per posting of the block's query terms; the entries held in memory at once
+# stay under BLOCK_POSTINGS, and a block's rows are rewritten in one transaction
+BLOCK_POSTINGS = 4_000_000
+BLOCK_ROWS = 1024
+
+WRITE_BATCH_SIZE = 500
+
+# DataVersion row bumped by every run that changes RelatedBook rows
+RELATED_VERSION = 'related'
+
+
+def description_digest(description):
+    return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+
+def words(text):
+    return re.findall(r'[^\W\d_]{2,}', text.lower())
+
+
+def heads(pointers, rows, limit):
+    """Positions of the first `limit` entries of the given CSR rows, and how many each row has."""
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = pointers[rows]
+    lengths = np.minimum(pointers[rows + 1] - starts, limit)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(lengths.sum()), lengths
+
+
+class DescriptionVectors:
+    """
+    L2-normalised TF-IDF vectors of book descriptions (sublinear term
+    frequency, smoothed idf) as a sparse books x terms matrix, stored both
+    per book (terms heaviest first) and per term (books heaviest first).
+    """
+
+    def __init__(self, books):
+        # books: list of (id, description)
+        self.ids = np.array([book_id for book_id, _ in books], dtype=np.int64)
+        counts = [Counter(words(description)) for _, description in books]
+        document_frequency = Counter(term for count in counts for term in count)
+        limit = MAX_DOCUMENT_SHARE * len(books)
+        vocabulary = sorted(term for term, df in document_frequency.items() if MIN_DOCUMENT_FREQUENCY <= df <= limit)
+        self.terms = {term: number for number, term in enumerate(vocabulary)}
+        idf = {term: math.log((1 + len(books)) / (1 + document_frequency[term])) + 1 for term in vocabulary}
+
+        rows, cols, values = [], [], []
+        for row, count in enumerate(counts):
+            weights = {term: (1 + math.log(tf)) * idf[term] for term, tf in count.items() if term in self.terms}
+            norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+            for term, weight in weights.items():
+                rows.append(row)
+                cols.append(self.terms[term])
+                values.append(weight / norm)
+        rows = np.array(rows, dtype=np.int64)
+        cols = np.array(cols, dtype=np.int64)
+        values = np.array(values)
+
+        # Row-wise (per book) and column-wise (per term) copies of the matrix
+        order = np.lexsort((-values, rows))
+        self.row_ptr = np.zeros(len(books) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(books)), out=self.row_ptr[1:])
+        self.row_terms, self.row_weights = cols[order], values[order]
+        order = np.lexsort((rows, -values, cols))
+        self.term_ptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cols, minlength=len(vocabulary)), out=self.term_ptr[1:])
+        self.term_books, self.term_weights = rows[order], values[order]
+
+        # How many postings each book's query terms have, i.e. the entries
+        # scores() builds for it
+        all_rows = np.arange(len(books))
+        positions, lengths = self.query_terms(all_rows)
+        postings = np.minimum(np.diff(self.term_ptr)[self.row_terms[positions]], TERM_POSTINGS)
+        self.query_postings = np.bincount(np.repeat(all_rows, lengths), weights=postings,
+                                          minlength=len(books)).astype(np.int64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def query_terms(self, block):
+        """Positions in row_terms of each book's QUERY_TERMS heaviest terms, and how many each has."""
+        return heads(self.row_ptr, block, QUERY_TERMS)
+
+    def blocks(self, rows):
+        """
+        Splits row numbers into blocks for scores() of at most BLOCK_ROWS books
+        whose postings stay under BLOCK_POSTINGS. A book with more postings
+        than that on its own gets a block to itself.
+        """
+        block, postings = [], 0
+        for row in rows:
+            volume = int(self.query_postings[row])
+            if block and (len(block) == BLOCK_ROWS or postings + volume > BLOCK_POSTINGS):
+                yield block
+                block, postings = [], 0
+            block.append(row)
+            postings += volume
+        if block:
+            yield block
+
+    def scores(self, block):
+        """
+        Cosine similarity of each book in `block` (row numbers) to the books
+        it shares a term with, as sparse (block row, book row, score) arrays
+        sorted by block row: one sparse-times-sparse product accumulated over
+        the postings of the block's terms, never a row per book in the catalog.
+        A term shared by more than TERM_POSTINGS books only adds to the books
+        that weigh it most; the rest hold it at a lower weight than those.
+        """
+        block = np.asarray(block, dtype=np.int64)
+        positions, lengths = self.query_terms(block)
+        query_rows = np.repeat(np.arange(len(block)), lengths)
+        query_terms, query_weights = self.row_terms[positions], self.row_weights[positions]
+
+        postings, posting_lengths = heads(self.term_ptr, query_terms, TERM_POSTINGS)
+        targets = np.repeat(query_rows, posting_lengths) * len(self) + self.term_books[postings]
+        products = np.repeat(query_weights, posting_lengths) * self.term_weights[postings]
+        targets, inverse = np.unique(targets, return_inverse=True)
+        scores = np.bincount(inverse, weights=products)
+        rows, books = np.divmod(targets, len(self))
+        return rows, books, scores
+
+    def neighbours(self, block, k=NEIGHBOURS):
+        """[(ids, scores)] of the k most similar books for each book of a block."""
+        block = np.asarray(block, dtype=np.int64)
+        rows, books, scores = self.scores(block)
+        keep = (books != block[rows]) & (scores > 0)
+        rows, books, scores = rows[keep], books[keep], scores[keep]
+        bounds = np.searchsorted(rows, np.arange(len(block) + 1))
+        related = []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            books_found, scores_found = top_k(books[start:stop], scores[start:stop], k)
+            related.append((self.ids[books_found], scores_found))
+        return related
+
+    def reached(self, block, weakest):
+        """Row numbers of the books that some book of the block scores above weakest[book] with."""
+        _, books, scores = self.scores(block)
+        return np.unique(books[scores > weakest[books]])
+
+
+def build_related_books(full=False, k=NEIGHBOURS):
+    """
+    Recomputes RelatedBook rows. An incremental run only redoes the books
+    whose description changed since the last run, plus the books whose lists
+    those changes reach: lists that named a changed book, and lists a changed
+    book now scores high enough to join. Returns the number of books refreshed.
+    """
+    books = [
+        (book_id, description)
+        for book_id, description in Book.objects.values_list('id', 'description').order_by('id').iterator(chunk_size=5000)
+        if description and description.strip() and description.strip() != NO_DESCRIPTION
+    ]
+    digests = {book_id: description_digest(description) for book_id, description in books}
+    stored = {} if full else dict(DescriptionDigest.objects.values_list('book_id', 'digest'))
+    vectors = DescriptionVectors(books)
+    rows = {book_id: row for row, book_id in enumerate(vectors.ids.tolist())}
+
+    if full or not stored:
+        dirty = set(rows)
+        gone = set()
+    else:
+        changed = {book_id for book_id, digest in digests.items() if stored.get(book_id) != digest}
+        gone = set(stored) - set(digests)
+        dirty = set(changed)
+        # Books whose current list mentions a changed or vanished book
+        dirty.update(RelatedBook.objects.filter(related_id__in=changed | gone).values_list('book_id', flat=True))
+        # Books a changed book might now join the list of: it scores above their weakest neighbour
+        weakest = np.zeros(len(vectors))
+        for book_id, score in RelatedBook.objects.filter(rank=k - 1).values_list('book_id', 'score'):
+            if book_id in rows:
+                weakest[rows[book_id]] = score
+        changed_rows = [rows[book_id] for book_id in changed if book_id in rows]
+        for block in vectors.blocks(changed_rows):
+            dirty.update(vectors.ids[vectors.reached(block, weakest)].tolist())
+        dirty &= set(rows)
+
+    refreshed = 0
+    for block in vectors.blocks(sorted(rows[book_id] for book_id in dirty)):
+        related = [
+            RelatedBook(book_id=int(vectors.ids[book]), related_id=int(related_id), score=float(score), rank=rank)
+            for book, (related_ids, related_scores) in zip(block, vectors.neighbours(block, k))
+            for rank, (related_id, score) in enumerate(zip(related_ids, related_scores))
+        ]
+        block_ids = vectors.ids[block].tolist()
+        with transaction.atomic():
+            RelatedBook.objects.filter(book_id__in=block_ids).delete()
+            RelatedBook.objects.bulk_create(related, batch_size=WRITE_BATCH_SIZE)
+        refreshed += len(block)
+
+    with transaction.atomic():
+        if full:
+            # Books that no longer have a description to compare
+            RelatedBook.objects.exclude(book_id__in=list(rows)).delete()
+            DescriptionDigest.objects.exclude(book_id__in=list(rows)).delete()
+        elif gone:
+            RelatedBook.objects.filter(book_id__in=gone).delete()
+            DescriptionDigest.objects.filter(book_id__in=gone).delete()
+        new_digests = [
+            DescriptionDigest(book_id=book_id, digest=digest)
+            for book_id, digest in digests.items() if stored.get(book_id) != digest
+        ]
+        for batch in batched(new_digests, WRITE_BATCH_SIZE):
+            DescriptionDigest.objects.bulk_create(
+                batch, update_conflicts=True, unique_fields=['book'], update_fields=['digest'])
+        if refreshed or gone or full:
+            bump_version(RELATED_VERSION)
+    return refreshed
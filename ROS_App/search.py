@@ -0,0 +1,169 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Book
+
+
+FTS_TABLE = 'ROS_App_book_fts'
+BOOK_TABLE = Book._meta.db_table
+
+# Column weights for bm25(): a title hit counts more than an author hit,
+# which counts more than a hit somewhere in the description
+BM25_WEIGHTS = (10.0, 5.0, 1.0)
+
+# Control characters that never appear in book text, used to mark highlights
+# before the text is HTML-escaped
+MARK_START, MARK_END = '\x02', '\x03'
+
+SEARCH_INDEX_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS "{FTS_TABLE}" USING fts5(
+        title, author, description,
+        content="{BOOK_TABLE}", content_rowid="id",
+        tokenize="unicode61 remove_diacritics 2", prefix="2 3"
+    )""",
+    # External-content triggers: the index follows every write to the book
+    # table, including bulk_create()/bulk_update() which never send signals
+    f"""CREATE TRIGGER IF NOT EXISTS "{FTS_TABLE}_ai" AFTER INSERT ON "{BOOK_TABLE}" BEGIN
+        INSERT INTO "{FTS_TABLE}"(rowid, title, author, description)
+        VALUES (new.id, new.title, new.author, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS "{FTS_TABLE}_ad" AFTER DELETE ON "{BOOK_TABLE}" BEGIN
+        INSERT INTO "{FTS_TABLE}"("{FTS_TABLE}", rowid, title, author, description)
+        VALUES ('delete', old.id, old.title, old.author, old.description);
+    END""",
+    # Only text changes touch the index; rating and popularity updates don't.
+    # Recreated every time so older installs pick up the column list.
+    f'DROP TRIGGER IF EXISTS "{FTS_TABLE}_au"',
+    f"""CREATE TRIGGER "{FTS_TABLE}_au" AFTER UPDATE OF title, author, description ON "{BOOK_TABLE}" BEGIN
+        INSERT INTO "{FTS_TABLE}"("{FTS_TABLE}", rowid, title, author, description)
+        VALUES ('delete', old.id, old.title, old.author, old.description);
+        INSERT INTO "{FTS_TABLE}"(rowid, title, author, description)
+        VALUES (new.id, new.title, new.author, new.description);
+    END""",
+]
+
+
+def fts_available(using=connection):
+    return using.vendor == 'sqlite'
+
+
+def install_search_index(using=connection):
+    """
+    Creates the FTS5 index and its triggers if they are missing. Safe to run
+    repeatedly: SQLite drops a table's triggers whenever a migration rebuilds
+    the table, so this runs after every migrate.
+    """
+    if not fts_available(using):
+        return
+    with using.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s", [FTS_TABLE])
+        created = cursor.fetchone() is None
+        for statement in SEARCH_INDEX_SQL:
+            cursor.execute(statement)
+        if created:
+            rebuild_search_index(using)
+
+
+def rebuild_search_index(using=connection):
+    with using.cursor() as cursor:
+        cursor.execute(f"""INSERT INTO "{FTS_TABLE}"("{FTS_TABLE}") VALUES ('rebuild')""")
+
+
+def match_expression(query):
+    """
+    Turns free text into an FTS5 MATCH expression. Every word is quoted (so
+    user input can't inject FTS syntax) and prefix-matched, so 'harry pot'
+    finds 'Harry Potter'.
+    """
+    words = re.findall(r'\w+', query.lower())
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def highlighted(text):
+    """HTML-escapes text from highlight()/snippet() and turns the markers into <mark> tags."""
+    text = escape(text or '')
+    return mark_safe(text.replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+class SearchResults:
+    """
+    Lazily evaluated, BM25-ranked search results. Supports count() and slicing,
+    so it can be handed straight to a Paginator: each page is one LIMIT/OFFSET
+    query against the index.
+    """
+
+    def __init__(self, query):
+        self.query = query
+        self.match = match_expression(query)
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            if not self.match:
+                self._count = 0
+            elif fts_available():
+                with connection.cursor() as cursor:
+                    cursor.execute(f'SELECT count(*) FROM "{FTS_TABLE}" WHERE "{FTS_TABLE}" MATCH %s', [self.match])
+                    self._count = cursor.fetchone()[0]
+            else:
+                self._count = self._fallback().count()
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        stop = self.count() if index.stop is None else index.stop
+        if not self.match or stop <= start:
+            return []
+        if not fts_available():
+            return [self._fallback_result(book) for book in self._fallback()[start:stop]]
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""SELECT b.id, b.title, b.author, b.cover_image, b.category,
+                           highlight("{FTS_TABLE}", 0, %s, %s),
+                           highlight("{FTS_TABLE}", 1, %s, %s),
+                           snippet("{FTS_TABLE}", 2, %s, %s, '…', 16)
+                    FROM "{FTS_TABLE}" JOIN "{BOOK_TABLE}" b ON b.id = "{FTS_TABLE}".rowid
+                    WHERE "{FTS_TABLE}" MATCH %s
+                    ORDER BY bm25("{FTS_TABLE}", %s, %s, %s)
+                    LIMIT %s OFFSET %s""",
+                [MARK_START, MARK_END] * 3 + [self.match, *BM25_WEIGHTS, stop - start, start],
+            )
+            rows = cursor.fetchall()
+
+        return [{
+            'id': book_id,
+            'title': title,
+            'author': author,
+            'cover': cover_image,
+            'category': category,
+            'title_html': highlighted(title_html),
+            'author_html': highlighted(author_html),
+            'snippet_html': highlighted(snippet_html),
+        } for book_id, title, author, cover_image, category, title_html, author_html, snippet_html in rows]
+
+    def _fallback(self):
+        # Databases without FTS5 get a plain, unranked substring search
+        return Book.objects.filter(Q(title__icontains=self.query) | Q(author__icontains=self.query)).order_by('title')
+
+    @staticmethod
+    def _fallback_result(book):
+        return {
+            'id': book.id,
+            'title': book.title,
+            'author': book.author,
+            'cover': book.cover_image.name,
+            'category': book.category,
+            'title_html': escape(book.title),
+            'author_html': escape(book.author),
+            'snippet_html': escape((book.description or '')[:160]),
+        }
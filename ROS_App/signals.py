@@ -0,0 +1,77 @@
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.db import transaction
+from django.dispatch import receiver
+
+from .catalog import catalog_changed
+from .covers import delete_variants, generate_cover
+from .models import Book, Review
+from .ratings import reviews_changed, update_ratings
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def book_changed(sender, **kwargs):
+    catalog_changed()
+
+
+@receiver(pre_save, sender=Book)
+def note_cover_upload(sender, instance, **kwargs):
+    # An uncommitted FieldFile is a new upload that this save will store
+    instance._cover_uploaded = bool(instance.cover_image) and not instance.cover_image._committed
+    instance._replaced_cover = None
+    if instance._cover_uploaded and instance.pk:
+        instance._replaced_cover = Book.objects.filter(pk=instance.pk).values_list('cover_image', flat=True).first()
+
+
+@receiver(post_save, sender=Book)
+def book_cover_saved(sender, instance, **kwargs):
+    # Covers uploaded through Book.cover_image get their thumbnails straight
+    # away; imports generate theirs in bulk across a process pool
+    if getattr(instance, '_cover_uploaded', False):
+        generate_cover(instance.cover_image.name)
+        if instance._replaced_cover and instance._replaced_cover != instance.cover_image.name:
+            release_cover(instance._replaced_cover)
+
+
+@receiver(post_delete, sender=Book)
+def book_cover_deleted(sender, instance, **kwargs):
+    if instance.cover_image:
+        release_cover(instance.cover_image.name)
+
+
+def release_cover(name):
+    """
+    Deletes a stored cover and its thumbnails once no book uses it. Covers are
+    shared by content, so the reference count is the number of Book rows that
+    name the file.
+    """
+    storage = Book._meta.get_field('cover_image').storage
+    if not storage.is_content_name(name) or Book.objects.filter(cover_image=name).exists():
+        return
+    transaction.on_commit(lambda: (storage.delete(name), delete_variants(name)))
+
+
+@receiver(post_init, sender=Review)
+def remember_counted_rating(sender, instance, **kwargs):
+    # The (book, rating) this review currently contributes to Book's aggregates
+    instance._counted_rating = (instance.book_id, instance.rating) if instance.pk else None
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, **kwargs):
+    current = (instance.book_id, int(instance.rating))
+    previous = instance._counted_rating
+    if previous == current:
+        reviews_changed(instance.book_id)
+        return
+    if previous is not None:
+        update_ratings(previous[0], previous[1], -1)
+    update_ratings(current[0], current[1], 1)
+    instance._counted_rating = current
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    if instance._counted_rating is not None:
+        update_ratings(*instance._counted_rating, -1)
+        instance._counted_rating = None
@@ -0,0 +1,125 @@
+import gzip
+import hashlib
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(file):
+    """sha256 hex digest of a Django File (or any object with chunks())."""
+    digest = hashlib.sha256()
+    for chunk in file.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    return digest.hexdigest()
+
+
+class AlreadyStored(Exception):
+    pass
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every file under the sha256 of its contents, e.g.
+    'books/covers/3f/3f9a...e1.jpg'. Saving bytes that are already stored
+    writes nothing and returns the existing name, so re-uploading a cover never
+    makes a suffixed copy, and a name's contents never change, so its URL can
+    be cached forever. Files are shared between rows; deleting one that is
+    still referenced is the caller's job to avoid (see ROS_App.signals).
+    """
+
+    def content_name(self, name, digest):
+        directory, basename = os.path.split(name)
+        extension = os.path.splitext(basename)[1].lower()
+        return os.path.join(directory, digest[:2], digest + extension).replace('\\', '/')
+
+    def get_available_name(self, name, max_length=None):
+        # The final name comes from the contents in _save(). FileSystemStorage
+        # also asks again when another process wrote the same name first,
+        # which for a content name means the file is already stored.
+        if self.is_content_name(name) and self.exists(name):
+            raise AlreadyStored
+        return name
+
+    def _save(self, name, content):
+        name = self.content_name(name, file_digest(content))
+        if self.exists(name):
+            return name
+        try:
+            return super()._save(name, content)
+        except AlreadyStored:
+            return name
+
+    def store_path(self, path, upload_to):
+        """Stores a file from disk under `upload_to` and returns its name."""
+        with open(path, 'rb') as handle:
+            return self.save(os.path.join(upload_to, os.path.basename(path)), File(handle))
+
+    def name_for_path(self, path, upload_to):
+        """The name store_path() would give a file, without storing it."""
+        with open(path, 'rb') as handle:
+            return self.content_name(os.path.join(upload_to, os.path.basename(path)), file_digest(File(handle)))
+
+    def is_content_name(self, name):
+        stem = os.path.splitext(os.path.basename(name))[0]
+        return len(stem) == 64 and all(char in '0123456789abcdef' for char in stem)
+
+
+def cover_storage():
+    # A callable, so migrations don't serialize the storage's settings
+    return ContentAddressedStorage()
+
+
+# Collected files worth gzipping; images and fonts are compressed already
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.xml', '.html', '.map'}
+
+# Keep a .gz only if it saves at least this share of the file
+MIN_COMPRESSION_SAVING = 0.05
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    collectstatic copies each file under a name with its content hash in it
+    (CSS url() references are rewritten to match), so those names can be
+    cached forever, and writes a gzipped copy next to every text file for
+    ROS_App.middleware.StaticFilesMiddleware to send to clients that accept it.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+                self.write_gzip(name)
+
+    def write_gzip(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as file:
+            data = file.read()
+        # mtime=0 makes the output depend on the contents only
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(compressed) <= len(data) * (1 - MIN_COMPRESSION_SAVING):
+            with open(f'{path}.gz', 'wb') as file:
+                file.write(compressed)
+        elif os.path.exists(f'{path}.gz'):
+            os.remove(f'{path}.gz')
+
+    def stored_name(self, name):
+        # Before collectstatic has been run (a fresh checkout, the tests)
+        # there is no manifest, so use the plain names. A file missing from
+        # the manifest, e.g. a catalog cover with no image, gets its plain
+        # name too, and a 404, rather than failing the whole page.
+        if not self.hashed_files:
+            return name
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
@@ -0,0 +1,104 @@
+import heapq
+from bisect import bisect_left
+
+from .catalog import CATALOG_VERSION, VersionedIndex, normalize
+from .models import Book
+from .trending import TRENDING_VERSION
+
+
+# Prefixes up to this length match so many keys that their top results are
+# precomputed when the index is built, as are those of longer prefixes that
+# match more than MAX_SCANNED_KEYS keys; any other prefix ranks at most that many
+PRECOMPUTED_PREFIX_LENGTH = 3
+MAX_SCANNED_KEYS = 500
+
+MAX_SUGGESTIONS = 20
+
+
+class PrefixIndex:
+    """
+    Autocomplete over normalized titles and author names. Keys live in one
+    sorted list, so a prefix is a bisect range; each key also has a title
+    suffix entry for every later word, so 'potter' finds 'Harry Potter ...'.
+    Short prefixes, and any prefix whose range is too long to scan per request,
+    have their top results precomputed.
+    """
+
+    def __init__(self, books, k=MAX_SUGGESTIONS):
+        # books: iterable of (id, title, author, popularity)
+        self.k = k
+        self.suggestions = []  # (popularity, suggestion dict), indexed by number
+        authors = {}
+        entries = []
+
+        for book_id, title, author, popularity in books:
+            number = len(self.suggestions)
+            self.suggestions.append((popularity, {'type': 'book', 'id': book_id, 'title': title, 'author': author}))
+            words = normalize(title).split(' ')
+            for start in range(len(words)):
+                entries.append((' '.join(words[start:]), number))
+
+            key = normalize(author)
+            if key not in authors:
+                authors[key] = len(self.suggestions)
+                self.suggestions.append((popularity, {'type': 'author', 'name': author}))
+                entries.append((key, authors[key]))
+            elif popularity > self.suggestions[authors[key]][0]:
+                # An author ranks as high as their most popular book
+                self.suggestions[authors[key]] = (popularity, self.suggestions[authors[key]][1])
+
+        entries.sort()
+        self.keys = [key for key, _ in entries]
+        self.numbers = [number for _, number in entries]
+
+        # Walks down from the empty prefix, one character at a time, into the
+        # ranges that still need precomputing
+        self.top = {}
+        pending = [('', 0, len(self.keys))]
+        while pending:
+            prefix, start, stop = pending.pop()
+            position = start
+            while position < stop:
+                if len(self.keys[position]) == len(prefix):
+                    position += 1  # a key equal to the prefix
+                    continue
+                longer = self.keys[position][:len(prefix) + 1]
+                end = bisect_left(self.keys, longer + '\uffff', position, stop)
+                if len(longer) <= PRECOMPUTED_PREFIX_LENGTH or end - position > MAX_SCANNED_KEYS:
+                    self.top[longer] = self._rank(set(self.numbers[position:end]))
+                if len(longer) < PRECOMPUTED_PREFIX_LENGTH or end - position > MAX_SCANNED_KEYS:
+                    pending.append((longer, position, end))
+                position = end
+
+    def __len__(self):
+        return len(self.suggestions)
+
+    def _rank(self, numbers):
+        best = heapq.nsmallest(self.k, numbers, key=lambda number: (-self.suggestions[number][0], number))
+        return [self.suggestions[number][1] for number in best]
+
+    def complete(self, prefix, limit=10):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        if prefix in self.top:
+            return self.top[prefix][:limit]
+        if len(prefix) <= PRECOMPUTED_PREFIX_LENGTH:
+            return []  # no key starts with it
+        # Not precomputed, so at most MAX_SCANNED_KEYS keys start with it
+        start = bisect_left(self.keys, prefix)
+        stop = bisect_left(self.keys, prefix + '\uffff', start)
+        return self._rank(set(self.numbers[start:stop]))[:limit]
+
+
+def build_prefix_index():
+    rows = Book.objects.values_list('id', 'title', 'author', 'popularity_score').iterator(chunk_size=2000)
+    return PrefixIndex(rows)
+
+
+# Ranked by popularity, so rebuilt when the trending scores change too
+prefix_index = VersionedIndex(build_prefix_index, (CATALOG_VERSION, TRENDING_VERSION))
+
+
+def suggest(prefix, limit=10):
+    return prefix_index.get().complete(prefix, limit=min(limit, MAX_SUGGESTIONS))
@@ -1,4 +1,10 @@
+import os
+
 from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from ..covers import DISPLAY_WIDTHS, FORMATS, cover_info, cover_url, original_url
 
 register = template.Library()
 
@@ -10,3 +16,45 @@ def to(value):
         return range(1, int(value) + 1)
     except TypeError:
         return []
+
+# Which of the user's lists a book is on: {{ book.id|list_status:membership }}
+@register.filter(name='list_status')
+def list_status(book_id, membership):
+    if not membership:
+        return None
+    return membership.status(book_id)
+
+# A book cover, WebP first with a JPEG fallback. srcset lists every generated
+# size so the browser fetches the smallest one that fills `size` on its
+# screen; width/height reserve the space, and a tiny inline placeholder is
+# painted until the image arrives. Covers that haven't been generated yet
+# fall back to the full-size original.
+# Usage: {% cover book.cover 'grid' book.title %}, with lazy=False for a
+# cover that is on screen when the page opens
+@register.simple_tag
+def cover(name, size, alt='', css_class='', lazy=True):
+    name = str(name or '')
+    class_attr = format_html(' class="{}"', css_class) if css_class else ''
+    loading = 'lazy' if lazy else 'eager'
+    info = cover_info(name)
+    if info is None:
+        original = original_url(name) or static(f'images/{os.path.basename(name)}')
+        return format_html('<img src="{}" alt="{}" loading="{}" decoding="async"{}>', original, alt, loading, class_attr)
+
+    # Thumbnails are never upscaled, so small originals repeat a width
+    widths = {}
+    for variant, (width, _) in sorted(info['sizes'].items(), key=lambda item: item[1][0]):
+        widths.setdefault(width, variant)
+    srcset = {
+        ext: ', '.join(f'{cover_url(name, variant, ext)} {width}w' for width, variant in widths.items())
+        for ext in FORMATS
+    }
+    width, height = info['sizes'][size]
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" loading="{}" decoding="async"'
+        ' style="background: url({}) center / cover no-repeat"{}></picture>',
+        srcset['webp'], DISPLAY_WIDTHS[size],
+        cover_url(name, size, 'jpg'), srcset['jpg'], DISPLAY_WIDTHS[size], width, height, alt, loading,
+        info['placeholder'], class_attr,
+    )
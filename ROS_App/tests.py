@@ -1,7 +1,36 @@
 from django.test import TestCase
 from django.contrib.auth.models import User
-from .models import Book, TBR, Review
+from .models import Book, Category, Recommendation, RelatedBook, SimilarBook, TBR, SkippedBooks, Review
 from django.urls import reverse
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.conf import settings
+from django.core.management import call_command
+from io import StringIO
+from .catalog import catalog_changed, catalog_version
+from .search import SearchResults
+from .suggest import PrefixIndex
+from .fuzzy import fuzzy_search
+from .lists import add_to_list, get_membership
+from .trending import update_trending
+from .covers import FORMATS, SIZES, cover_info, cover_stem, variant_name
+from .related import DescriptionVectors
+from django.template import Context, Template
+from django.templatetags.static import static
+from PIL import Image
+from io import BytesIO
+from django.utils import timezone
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import transaction
+import base64
+import csv
+import gzip
+import os
+import re
+import shutil
+import tempfile
+from unittest import mock
 
 class TBRTest(TestCase):
 
@@ -197,3 +226,1189 @@ class TBRTest(TestCase):
         # Check if the book is removed from the user's TBR list
         tbr_entry = TBR.objects.filter(user=self.user, book=self.book)
         self.assertFalse(tbr_entry.exists())
+
+
+class CatalogSyncTest(TestCase):
+
+    def setUp(self):
+        # Importing stores the catalog covers under MEDIA_ROOT
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        shutil.copy(os.path.join(settings.MEDIA_ROOT, 'books.csv'), self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        User.objects.create_user(username="reader", password="12345")
+        self.client.login(username="reader", password="12345")
+        with open(os.path.join(self.media_root, 'books.csv'), newline='', encoding='utf-8-sig') as file:
+            self.rows = list(csv.DictReader(file))
+        self.book = next(row for row in self.rows if row['category'] == 'Classics')
+
+    def test_book_detail_uses_book_rows(self):
+        """Test that the detail page renders any Book row, imported or not, and 404s on unknown ids."""
+        book = Book.objects.create(id=999998, title="Added In The Admin", author="Author",
+                                   cover_image="books/covers/b.jpg")
+        response = self.client.get(reverse('book_detail', kwargs={'book_id': book.id}))
+        self.assertContains(response, book.title)
+        response = self.client.get(reverse('book_detail', kwargs={'book_id': 999999}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_book_detail_get_does_not_write(self):
+        """Test that a book only in books.csv is a 404 until it is imported, not a new row."""
+        response = self.client.get(reverse('book_detail', kwargs={'book_id': self.book['id']}))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Book.objects.exists())
+
+    def test_import_catalog_command(self):
+        """Test that import_catalog creates every catalog book and is idempotent."""
+        call_command('import_catalog', skip_covers=True, stdout=StringIO())
+        self.assertEqual(Book.objects.count(), len(self.rows))
+        db_book = Book.objects.get(id=self.book['id'])
+        self.assertEqual(db_book.title, self.book['title'])
+        self.assertEqual(db_book.category, 'Classics')
+
+        out = StringIO()
+        call_command('import_catalog', skip_covers=True, stdout=out)
+        self.assertIn('0 added, 0 updated, 0 kept', out.getvalue())
+
+    def test_reimport_reports_values_it_keeps(self):
+        """Test that CSV values differing from an edited book are reported as kept, or replaced with --overwrite."""
+        call_command('import_catalog', skip_covers=True, skip_related=True, stdout=StringIO())
+        Book.objects.filter(id=self.book['id']).update(title="Edited In The Admin")
+        for options in ({'dry_run': True}, {}):
+            out = StringIO()
+            call_command('import_catalog', skip_covers=True, skip_related=True, stdout=out, **options)
+            self.assertIn(f"kept {self.book['id']}: title", out.getvalue())
+            self.assertIn('0 updated, 1 kept', out.getvalue())
+            self.assertEqual(Book.objects.get(id=self.book['id']).title, "Edited In The Admin")
+
+        out = StringIO()
+        call_command('import_catalog', skip_covers=True, skip_related=True, overwrite=True, stdout=out)
+        self.assertIn('1 updated, 0 kept', out.getvalue())
+        self.assertEqual(Book.objects.get(id=self.book['id']).title, self.book['title'])
+
+    def test_import_rejects_covers_that_are_not_images_in_place(self):
+        """Test that a CSV cover can't name a file outside the cover directories or a non-image."""
+        with open(os.path.join(self.media_root, 'notes.jpg'), 'w') as file:
+            file.write("not an image")
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['id', 'title', 'author', 'cover', 'category', 'description'])
+            for number, cover in enumerate(['/etc/passwd', '../WAD/settings.py', '../../db.sqlite3.jpg',
+                                            'books.csv', 'dir/notes.jpg', 'notes.jpg', '21Romeo.jpg'], start=1):
+                writer.writerow([str(number), f'Book {number}', 'Author', cover, 'Fantasy', ''])
+        try:
+            out, err = StringIO(), StringIO()
+            call_command('import_catalog', path, skip_covers=True, skip_related=True, stdout=out, stderr=err)
+        finally:
+            os.remove(path)
+
+        self.assertIn('1 added', out.getvalue())
+        self.assertIn('6 failed', out.getvalue())
+        self.assertIn("cover '/etc/passwd' is not an image", err.getvalue())
+        self.assertEqual(list(Book.objects.values_list('id', flat=True)), [7])
+        stored = [name for _, _, files in os.walk(os.path.join(self.media_root, 'books')) for name in files]
+        self.assertEqual(len(stored), 1)
+
+    def test_review_on_unimported_book(self):
+        """Test that posting a review on a book that hasn't been imported doesn't create it."""
+        response = self.client.post(reverse('book_detail', kwargs={'book_id': self.book['id']}),
+                                    {'review': 'Loved it', 'rating': 5})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Book.objects.exists())
+        self.assertFalse(Review.objects.exists())
+
+    def test_import_catalog_batches_and_reports_failures(self):
+        """Test that a CSV is imported across batches with bad rows reported, not fatal."""
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['id', 'title', 'author', 'cover', 'category', 'description'])
+            writer.writerow(['1', 'Dune', 'Frank Herbert', '21Romeo.jpg', 'fantasy', ''])
+            writer.writerow(['oops', 'Broken', 'Nobody', '', 'Fantasy', ''])
+            writer.writerow(['2', 'Emma', 'Jane Austen', '9RWRB.jpg', 'Classics', 'Matchmaking.'])
+        Category.objects.create(name='Fantasy')
+        try:
+            out, err = StringIO(), StringIO()
+            call_command('import_catalog', path, batch_size=2, stdout=out, stderr=err)
+        finally:
+            os.remove(path)
+
+        self.assertIn('2 added', out.getvalue())
+        self.assertIn('1 failed', out.getvalue())
+        self.assertIn("line 3: invalid id 'oops'", err.getvalue())
+        dune = Book.objects.get(id=1)
+        self.assertEqual(dune.category, 'Fantasy')  # resolved onto the existing spelling
+        self.assertRegex(dune.cover_image.name, r'^books/covers/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(Category.objects.filter(name__iexact='fantasy').count(), 1)
+        self.assertTrue(Category.objects.filter(name='Classics').exists())
+
+
+class AdminCSVUploadTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        # Covers named by the CSV must be real images
+        os.makedirs(os.path.join(self.media_root, 'books', 'covers'))
+        for number, name in enumerate(['dune.jpg', 'emma.jpg']):
+            Image.new('RGB', (20, 30), (number * 100, 0, 0)).save(os.path.join(self.media_root, 'books', 'covers', name))
+
+        User.objects.create_superuser(username="admin", password="12345", email="admin@example.com")
+        self.client.login(username="admin", password="12345")
+        Book.objects.create(id=1, title="Dune", author="Frank Herbert", category="Fantasy",
+                            description="Spice.", cover_image="books/covers/dune.jpg")
+
+    def upload(self, dry_run=False, overwrite=False):
+        content = '\n'.join([
+            'id,title,author,cover,category,description',
+            '1,Dune,Frank Herbert,dune.jpg,Fantasy,Spice must flow.',
+            '2,Emma,Jane Austen,emma.jpg,Classics,Matchmaking.',
+            ',No Id,Someone,,Fantasy,',
+        ]).encode('utf-8')
+        data = {'csv_file': SimpleUploadedFile('books.csv', content, content_type='text/csv')}
+        if dry_run:
+            data['dry_run'] = '1'
+        if overwrite:
+            data['overwrite'] = '1'
+        return self.client.post(reverse('admin:upload_csv'), data, follow=True)
+
+    def test_upload_reports_a_single_summary(self):
+        """Test that an upload upserts in bulk and reports one summary message."""
+        response = self.upload(overwrite=True)
+        self.assertEqual(response.status_code, 200)
+        summary = [str(message) for message in response.context['messages']]
+        self.assertEqual(len(summary), 1)
+        self.assertIn('1 added, 1 updated, 0 kept, 0 unchanged, 1 failed', summary[0])
+        self.assertEqual(Book.objects.get(id=1).description, 'Spice must flow.')
+        self.assertTrue(Book.objects.filter(id=2, title='Emma').exists())
+
+        errors = self.client.get(reverse('admin:upload_csv_errors', args=[response.context['error_token']]))
+        content = b''.join(errors.streaming_content).decode('utf-8')
+        self.assertIn("4,invalid id ''", content)
+
+    def test_upload_builds_thumbnails_and_similar_books(self):
+        """Test that an upload runs the same post-import steps as the import_catalog command."""
+        response = self.upload(dry_run=True)
+        self.assertNotIn('Similar books refreshed', str(list(response.context['messages'])[0]))
+
+        response = self.upload(overwrite=True)
+        self.assertIn('Similar books refreshed for 2 books', str(list(response.context['messages'])[0]))
+        for book in Book.objects.all():
+            thumbnail = os.path.join(self.media_root, variant_name(book.cover_image.name, 'grid', 'jpg'))
+            self.assertTrue(os.path.exists(thumbnail))
+
+    def test_upload_only_backfills_existing_books(self):
+        """Test that without overwrite an upload fills blank fields but keeps admin edits."""
+        Book.objects.filter(id=1).update(category='', description='no description available')
+        response = self.upload()
+        self.assertIn('1 added, 1 updated', str(list(response.context['messages'])[0]))
+        dune = Book.objects.get(id=1)
+        self.assertEqual((dune.category, dune.description), ('Fantasy', 'Spice must flow.'))
+        self.assertEqual(dune.cover_image.name, 'books/covers/dune.jpg')
+
+        Book.objects.filter(id=1).update(description='Edited in the admin.')
+        response = self.upload()
+        self.assertIn('0 added, 0 updated, 1 kept, 1 unchanged', str(list(response.context['messages'])[0]))
+        self.assertContains(response, 'Kept values')
+        self.assertContains(response, 'Spice must flow.')
+        self.assertEqual(Book.objects.get(id=1).description, 'Edited in the admin.')
+        # Covers are only stored for books that use them
+        stored = [name for _, _, files in os.walk(os.path.join(self.media_root, 'books', 'covers')) for name in files]
+        self.assertEqual(len(stored), 3)
+
+    def test_overwrite_releases_replaced_covers(self):
+        """Test that a cover no book uses after an overwriting upload is deleted."""
+        storage = Book._meta.get_field('cover_image').storage
+        old = os.path.join(self.media_root, 'old.jpg')
+        Image.new('RGB', (20, 30), (0, 0, 200)).save(old)
+        old_name = storage.store_path(old, 'books/covers/')
+        Book.objects.filter(id=1).update(cover_image=old_name)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload(overwrite=True)
+        self.assertFalse(storage.exists(old_name))
+        self.assertTrue(storage.exists(Book.objects.get(id=1).cover_image.name))
+
+    def test_dry_run_writes_nothing(self):
+        """Test that a dry run shows the diff without touching the database."""
+        response = self.upload(dry_run=True, overwrite=True)
+        self.assertContains(response, 'Spice must flow.')
+        self.assertEqual(Book.objects.get(id=1).description, 'Spice.')
+        self.assertFalse(Book.objects.filter(id=2).exists())
+
+    def test_upload_requires_staff(self):
+        """Test that the upload page is behind the admin login."""
+        self.client.logout()
+        response = self.client.get(reverse('admin:upload_csv'))
+        self.assertEqual(response.status_code, 302)
+
+
+class AdminCSVExportTest(TestCase):
+
+    def setUp(self):
+        User.objects.create_superuser(username="admin", password="12345", email="admin@example.com")
+        self.client.login(username="admin", password="12345")
+        for book_id in range(1, 6):
+            Book.objects.create(id=book_id, title=f"Book {book_id}", author="Author", category="Fantasy",
+                                description="Line one, with a comma", cover_image=f"books/covers/{book_id}.jpg")
+
+    def read_csv(self, response):
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode('utf-8')
+        return list(csv.reader(StringIO(content)))
+
+    def test_export_whole_table(self):
+        """Test that the full export streams every book in id order."""
+        rows = self.read_csv(self.client.get(reverse('admin:export_csv')))
+        self.assertEqual(rows[0], ['id', 'title', 'author', 'cover', 'category', 'description'])
+        self.assertEqual([row[0] for row in rows[1:]], ['1', '2', '3', '4', '5'])
+        self.assertEqual(rows[1][3], 'books/covers/1.jpg')
+        self.assertEqual(rows[1][5], 'Line one, with a comma')
+
+    def test_export_selection(self):
+        """Test that the admin action only exports the selected books."""
+        response = self.client.post(reverse('admin:ROS_App_book_changelist'), {
+            'action': 'export_books_to_csv',
+            '_selected_action': [2, 4],
+        })
+        rows = self.read_csv(response)
+        self.assertEqual([row[0] for row in rows[1:]], ['2', '4'])
+
+
+class FullTextSearchTest(TestCase):
+
+    def setUp(self):
+        User.objects.create_user(username="reader", password="12345")
+        self.client.login(username="reader", password="12345")
+        Book.objects.create(id=1, title="The Hobbit", author="J.R.R. Tolkien",
+                            description="Bilbo <Baggins> goes on an adventure.", cover_image="books/covers/hobbit.jpg")
+        Book.objects.create(id=2, title="The Fellowship of the Ring", author="J.R.R. Tolkien",
+                            description="A hobbit inherits a ring.", cover_image="books/covers/lotr.jpg")
+        Book.objects.create(id=3, title="Gone Girl", author="Gillian Flynn",
+                            description="Amy is missing.", cover_image="books/covers/gone.jpg")
+
+    def test_prefix_search_over_title_author_and_description(self):
+        """Test that partial words match authors and descriptions, ranked by BM25."""
+        self.assertEqual([book['id'] for book in SearchResults('tolk')[:]], [1, 2])
+        # The title hit outranks the description hit
+        self.assertEqual([book['id'] for book in SearchResults('hobbit')[:]], [1, 2])
+        self.assertEqual(SearchResults('missing').count(), 1)
+        self.assertEqual(SearchResults('"; DROP').count(), 0)
+
+    def test_results_are_highlighted_and_escaped(self):
+        """Test that matches are wrapped in <mark> and book text is escaped."""
+        result = SearchResults('bilbo')[0]
+        self.assertEqual(result['cover'], 'books/covers/hobbit.jpg')
+        self.assertIn('<mark>Bilbo</mark>', result['snippet_html'])
+        self.assertIn('&lt;Baggins&gt;', result['snippet_html'])
+
+    def test_index_follows_updates_and_deletes(self):
+        """Test that the triggers keep the index in sync with the Book table."""
+        Book.objects.filter(id=3).update(title="Sharp Objects")
+        self.assertEqual(SearchResults('gone').count(), 0)
+        self.assertEqual(SearchResults('sharp').count(), 1)
+        Book.objects.filter(id=3).delete()
+        self.assertEqual(SearchResults('sharp').count(), 0)
+
+    def test_search_view(self):
+        """Test that one hit redirects to the book and several render a page."""
+        response = self.client.get(reverse('search_books'), {'q': 'gone'})
+        self.assertRedirects(response, reverse('book_detail', kwargs={'book_id': 3}), fetch_redirect_response=False)
+        response = self.client.get(reverse('search_books'), {'q': 'tolkien'})
+        self.assertContains(response, '<mark>Tolkien</mark>')
+        self.assertEqual(response.context['page'].paginator.count, 2)
+
+
+class FuzzySearchTest(TestCase):
+
+    def setUp(self):
+        User.objects.create_user(username="reader", password="12345")
+        self.client.login(username="reader", password="12345")
+        Book.objects.create(id=1, title="The Hobbit", author="J.R.R. Tolkien", cover_image="books/covers/hobbit.jpg")
+        Book.objects.create(id=2, title="It Ends with Us", author="Colleen Hoover", cover_image="books/covers/ends.jpg")
+
+    def test_misspelled_authors(self):
+        """Test that common misspellings still find the right author."""
+        suggestion, books = fuzzy_search("Tolkein")
+        self.assertEqual(suggestion, "J.R.R. Tolkien")
+        self.assertEqual([book['id'] for book in books], [1])
+        suggestion, books = fuzzy_search("Colleen Hover")
+        self.assertEqual(suggestion, "Colleen Hoover")
+        self.assertEqual(fuzzy_search("zzzz"), (None, []))
+
+    def test_index_refreshes_when_books_change(self):
+        """Test that a new book is found without restarting the process."""
+        fuzzy_search("hobbit")
+        Book.objects.create(id=3, title="Gone Girl", author="Gillian Flynn", cover_image="books/covers/gone.jpg")
+        self.assertEqual(fuzzy_search("Gone Gril")[0], "Gone Girl")
+
+    def test_search_view_offers_did_you_mean(self):
+        """Test that a search with no exact hits shows a suggestion instead of bouncing home."""
+        response = self.client.get(reverse('search_books'), {'q': 'Tolkein'})
+        self.assertContains(response, 'Did you mean')
+        self.assertContains(response, 'J.R.R. Tolkien')
+
+
+class SearchSuggestTest(TestCase):
+
+    def setUp(self):
+        Book.objects.create(id=1, title="Harry Potter and the Sorcerer's Stone", author="J.K. Rowling",
+                            popularity_score=5, cover_image="books/covers/hp1.jpg")
+        Book.objects.create(id=2, title="Harry Potter and the Chamber of Secrets", author="J.K. Rowling",
+                            popularity_score=9, cover_image="books/covers/hp2.jpg")
+        Book.objects.create(id=3, title="Hamlet", author="William Shakespeare",
+                            popularity_score=1, cover_image="books/covers/hamlet.jpg")
+
+    def get(self, query, **headers):
+        return self.client.get(reverse('search_suggest'), {'q': query}, **headers)
+
+    def test_prefix_ranked_by_popularity(self):
+        """Test that short and long prefixes return the most popular matches first."""
+        results = self.get('ha').json()['results']
+        self.assertEqual([result.get('id') for result in results], [2, 1, 3])
+        results = self.get('harry potter and the s').json()['results']
+        self.assertEqual([result['id'] for result in results], [1])
+
+    def test_long_prefixes_with_many_keys_are_precomputed(self):
+        """Test that a long prefix matching more than MAX_SCANNED_KEYS keys is answered without a scan."""
+        books = Book.objects.values_list('id', 'title', 'author', 'popularity_score')
+        with mock.patch('ROS_App.suggest.MAX_SCANNED_KEYS', 1):
+            index = PrefixIndex(books)
+        self.assertIn('harry potter and the ', index.top)
+        self.assertNotIn('harry potter and the s', index.top)
+        self.assertEqual([result['id'] for result in index.complete('Harry Potter and the')], [2, 1])
+        self.assertEqual([result['id'] for result in index.complete('harry potter and the c')], [2])
+        self.assertEqual(index.complete('harry potter and then'), [])
+
+    def test_word_and_author_prefixes(self):
+        """Test that later title words and author names are completed too."""
+        self.assertEqual([result['id'] for result in self.get('chamb').json()['results']], [2])
+        self.assertEqual(self.get('j.k').json()['results'], [{'type': 'author', 'name': 'J.K. Rowling'}])
+        self.assertEqual(self.get('').json()['results'], [])
+
+    def test_etag_follows_catalog_version(self):
+        """Test that an unchanged catalog answers 304 and a change invalidates the ETag."""
+        response = self.get('ha')
+        etag = response['ETag']
+        self.assertIn('max-age', response['Cache-Control'])
+        self.assertEqual(self.get('ha', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Book.objects.create(id=4, title="Hatchet", author="Gary Paulsen", cover_image="books/covers/h.jpg")
+        response = self.get('ha', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(4, [result.get('id') for result in response.json()['results']])
+
+    def test_bulk_writes_reach_every_process(self):
+        """Test that the catalog version lives in the database, so other processes see an import."""
+        self.assertEqual([result.get('id') for result in self.get('ha').json()['results']], [2, 1, 3])
+        version = catalog_version()
+        cache.clear()  # what another process, with its own cache, sees
+        self.assertEqual(catalog_version(), version)
+
+        # As import_catalog does: bulk writes, which send no signals, then catalog_changed()
+        with transaction.atomic():
+            Book.objects.filter(id=3).update(title="Hatchet")
+            catalog_changed()
+        cache.clear()
+        self.assertNotEqual(catalog_version(), version)
+        self.assertEqual([result.get('id') for result in self.get('hat').json()['results']], [3])
+
+
+class CategoryViewTest(TestCase):
+
+    def setUp(self):
+        Category.objects.create(name='Fantasy')
+        Category.objects.create(name='Horror')
+        for book_id in range(1, 31):
+            Book.objects.create(id=book_id, title=f"Book {book_id:02d}", author="Author", category="Fantasy",
+                                popularity_score=book_id % 7, cover_image=f"books/covers/{book_id}.jpg")
+        Book.objects.create(id=99, title="Elsewhere", author="Author", category="Horror",
+                            cover_image="books/covers/99.jpg")
+
+    def walk(self, sort):
+        """Follows the next-page cursors and returns every book id in order."""
+        ids, params = [], {'sort': sort}
+        while True:
+            response = self.client.get(reverse('category_page', args=['fantasy']), params)
+            self.assertEqual(response.status_code, 200)
+            page = response.context['books']
+            ids += [book.id for book in page]
+            if not page.has_next:
+                return ids
+            params = {'sort': sort, 'after': page.next_cursor}
+
+    def test_keyset_pages_cover_the_category_once(self):
+        """Test that following cursors visits every book once in the requested order."""
+        by_title = self.walk('title')
+        self.assertEqual(by_title, list(range(1, 31)))
+        by_popularity = self.walk('popularity')
+        expected = sorted(range(1, 31), key=lambda book_id: (-(book_id % 7), book_id))
+        self.assertEqual(by_popularity, expected)
+
+    def test_rating_sort(self):
+        """Test that books are ordered by their average review rating."""
+        user = User.objects.create_user(username="reader", password="12345")
+        Review.objects.create(user=user, book_id=5, review="ok", rating=3)
+        Review.objects.create(user=user, book_id=9, review="great", rating=5)
+        self.assertEqual(self.walk('rating')[:3], [9, 5, 1])
+        self.assertEqual(len(self.walk('rating')), 30)
+
+    def test_any_category_and_unknown_category(self):
+        """Test that categories come from the data, not a hard-coded list."""
+        response = self.client.get(reverse('category_page', args=['horror']))
+        self.assertContains(response, 'Elsewhere')
+        self.assertNotContains(response, 'Book 01')
+        self.assertEqual(self.client.get(reverse('category_page', args=['poetry'])).status_code, 404)
+
+    def test_bad_cursor_starts_over(self):
+        """Test that a mangled cursor falls back to the first page."""
+        response = self.client.get(reverse('category_page', args=['fantasy']), {'after': '!!not-a-cursor'})
+        self.assertEqual(response.context['books'].items[0].id, 1)
+
+
+class RatingAggregateTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="reader", password="12345")
+        self.client.login(username="reader", password="12345")
+        self.book = Book.objects.create(id=7, title="Gone Girl", author="Gillian Flynn",
+                                        cover_image="books/covers/gone.jpg")
+
+    def assertRatings(self, count, total, histogram):
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.rating_count, count)
+        self.assertEqual(self.book.rating_sum, total)
+        self.assertAlmostEqual(self.book.rating_average, total / count if count else 0)
+        self.assertEqual([n for _, n in self.book.rating_histogram], histogram)
+
+    def test_create_edit_delete_keep_aggregates(self):
+        """Test that reviews created, edited and deleted through the views update Book."""
+        Review.objects.create(user=self.user, book=self.book, review="Good", rating=4)
+        review = Review.objects.create(user=self.user, book=self.book, review="Fine", rating=2)
+        self.assertRatings(2, 6, [0, 1, 0, 1, 0])
+
+        self.client.post(reverse('edit_review', args=[review.id]), {'review': 'Better', 'rating': 5})
+        self.assertRatings(2, 9, [1, 1, 0, 0, 0])
+
+        self.client.post(reverse('delete_review', args=[review.id]))
+        self.assertRatings(1, 4, [0, 1, 0, 0, 0])
+
+    def test_cascade_delete_updates_aggregates(self):
+        """Test that deleting a user removes their ratings from the book."""
+        other = User.objects.create_user(username="other", password="12345")
+        Review.objects.create(user=other, book=self.book, review="Meh", rating=1)
+        Review.objects.create(user=self.user, book=self.book, review="Good", rating=4)
+        other.delete()
+        self.assertRatings(1, 4, [0, 1, 0, 0, 0])
+
+    def test_book_detail_reads_aggregates(self):
+        """Test that the detail page doesn't aggregate over reviews."""
+        Review.objects.create(user=self.user, book=self.book, review="Good", rating=4)
+        Book.objects.filter(id=self.book.id).update(rating_average=2.5, rating_count=10)
+        response = self.client.get(reverse('book_detail', kwargs={'book_id': self.book.id}))
+        self.assertEqual(response.context['average_rating'], 2.5)
+        self.assertContains(response, 'from 10 ratings')
+
+    def test_recompute_ratings_repairs_drift(self):
+        """Test that the repair command rebuilds aggregates from the reviews."""
+        Review.objects.create(user=self.user, book=self.book, review="Good", rating=4)
+        Review.objects.create(user=self.user, book=self.book, review="Great", rating=5)
+        Book.objects.filter(id=self.book.id).update(rating_count=0, rating_sum=0, rating_average=0, rating_4=7)
+        out = StringIO()
+        call_command('recompute_ratings', stdout=out)
+        self.assertIn('1 books corrected', out.getvalue())
+        self.assertRatings(2, 9, [1, 1, 0, 0, 0])
+
+
+class ReviewFeedTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="reader", password="12345")
+        self.client.login(username="reader", password="12345")
+        self.book_id = Book.objects.create(title="Book", author="Author", cover_image="books/covers/b.jpg").id
+        for number in range(25):
+            writer = User.objects.create(username=f"writer{number}")
+            Review.objects.create(user=writer, book_id=self.book_id, review=f"Review {number}", rating=3)
+
+    def test_first_page_is_newest_and_query_count_is_flat(self):
+        """Test that the detail page shows one page of reviews without a query per author."""
+        url = reverse('book_detail', kwargs={'book_id': self.book_id})
+        self.client.get(url)  # warm the session
+        with self.assertNumQueries(6):  # session, user, book, versions for the validators, review page, related books
+            response = self.client.get(url)
+        reviews = response.context['reviews']
+        self.assertEqual([review.review for review in reviews][:2], ['Review 24', 'Review 23'])
+        self.assertEqual(len(reviews), 10)
+        self.assertTrue(reviews.has_next)
+
+    def test_load_more_walks_every_review_once(self):
+        """Test that the JSON endpoint pages through the rest of the reviews."""
+        first = self.client.get(reverse('book_detail', kwargs={'book_id': self.book_id})).context['reviews']
+        seen = [review.review for review in first]
+        cursor = first.next_cursor
+        while cursor:
+            data = self.client.get(reverse('book_reviews', kwargs={'book_id': self.book_id}), {'after': cursor}).json()
+            seen += [review['review'] for review in data['reviews']]
+            cursor = data['next']
+        self.assertEqual(seen, [f"Review {number}" for number in range(24, -1, -1)])
+
+
+class SavedBooksListTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="reader", password="12345")
+        self.client.login(username="reader", password="12345")
+        for number in range(30):
+            book = Book.objects.create(
+                title=f"Book {number:02}",
+                author="Author",
+                category="Fantasy" if number % 2 else "Romance",
+                cover_image="books/covers/b.jpg",
+            )
+            TBR.objects.create(user=self.user, book=book)
+            SkippedBooks.objects.create(user=self.user, book=book)
+
+    def test_query_count_is_flat(self):
+        """Test that a page of the TBR list costs the same few queries however many books it shows."""
+        with self.assertNumQueries(4):  # session, user, categories, entries with their books
+            response = self.client.get(reverse('tbr_list'))
+        self.assertEqual(len(response.context['books']), 24)
+        self.assertEqual(response.context['books'][0].title, "Book 29")
+        self.assertEqual(response.context['categories'], ['Fantasy', 'Romance'])
+
+    def test_next_page_continues_where_first_ended(self):
+        """Test that following the cursor shows the remaining books once each."""
+        first = self.client.get(reverse('skipped_book_list'), {'sort': 'title'}).context
+        second = self.client.get(
+            reverse('skipped_book_list'), {'sort': 'title', 'after': first['page'].next_cursor}).context
+        titles = [book.title for book in first['books'] + second['books']]
+        self.assertEqual(titles, [f"Book {number:02}" for number in range(30)])
+        self.assertFalse(second['page'].has_next)
+
+    def test_filter_by_category(self):
+        """Test that the category filter only shows books from that category."""
+        response = self.client.get(reverse('tbr_list'), {'category': 'Romance', 'sort': 'oldest'})
+        books = response.context['books']
+        self.assertEqual(len(books), 15)
+        self.assertTrue(all(book.category == 'Romance' for book in books))
+        self.assertEqual(books[0].title, "Book 00")
+
+    def test_add_is_one_insert(self):
+        """Test that adding a book to a list is a single statement and never duplicates it."""
+        book = Book.objects.create(title="New", author="Author", cover_image="books/covers/b.jpg")
+        url = reverse('add_to_skipped', kwargs={'book_id': book.id})
+        self.client.post(url)
+        with self.assertNumQueries(4):  # session, user, book, insert
+            response = self.client.post(url)
+        self.assertFalse(response.json()['success'])
+        self.assertEqual(SkippedBooks.objects.filter(user=self.user, book=book).count(), 1)
+
+
+class BatchListUpdateTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="reader", password="12345")
+        self.client.login(username="reader", password="12345")
+        self.books = [
+            Book.objects.create(title=f"Book {number}", author="Author", cover_image="books/covers/b.jpg")
+            for number in range(4)
+        ]
+        TBR.objects.create(user=self.user, book=self.books[0])
+
+    def post(self, operations):
+        return self.client.post(
+            reverse('update_lists'), {'operations': operations}, content_type='application/json')
+
+    def test_operations_apply_in_order_with_per_item_results(self):
+        """Test that add, remove and move operations are applied and reported one by one."""
+        first, second, third, fourth = (book.id for book in self.books)
+        response = self.post([
+            {'op': 'add', 'list': 'tbr', 'book': second},
+            {'op': 'add', 'list': 'tbr', 'book': first},
+            {'op': 'move', 'from': 'tbr', 'to': 'skipped', 'book': first},
+            {'op': 'add', 'list': 'skipped', 'book': third},
+            {'op': 'remove', 'list': 'skipped', 'book': third},
+            {'op': 'remove', 'list': 'tbr', 'book': fourth},
+            {'op': 'add', 'list': 'tbr', 'book': 9999},
+            {'op': 'shelve', 'list': 'tbr', 'book': fourth},
+        ])
+        results = response.json()['results']
+        self.assertEqual([result.get('changed') for result in results], [True, False, True, True, True, False, None, None])
+        self.assertEqual(results[6], {'success': False, 'message': 'Book not found.'})
+        self.assertFalse(results[7]['success'])
+        self.assertEqual(list(TBR.objects.filter(user=self.user).values_list('book_id', flat=True)), [second])
+        self.assertEqual(list(SkippedBooks.objects.filter(user=self.user).values_list('book_id', flat=True)), [first])
+
+    def test_out_of_range_ids_are_per_item_errors(self):
+        """Test that ids that don't fit a 64-bit column are reported per operation, not a server error."""
+        response = self.post([
+            {'op': 'add', 'list': 'tbr', 'book': 2 ** 63},
+            {'op': 'add', 'list': 'tbr', 'book': -(2 ** 70)},
+            {'op': 'add', 'list': 'tbr', 'book': 0},
+            {'op': 'add', 'list': 'skipped', 'book': self.books[1].id},
+        ])
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['success'] for result in results], [False, False, False, True])
+        self.assertEqual(results[0]['message'], "'book' must be a book id.")
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        """Test that a batch costs the same queries for two books as for many."""
+        operations = [{'op': 'add', 'list': 'skipped', 'book': book.id} for book in self.books]
+        operations += [{'op': 'remove', 'list': 'tbr', 'book': book.id} for book in self.books]
+        # session, user, savepoint, books, two list reads, lists version, tbr delete, skipped insert, release
+        with self.assertNumQueries(10):
+            response = self.post(operations)
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(SkippedBooks.objects.filter(user=self.user).count(), 4)
+        self.assertFalse(TBR.objects.filter(user=self.user).exists())
+
+    def test_rejects_malformed_body(self):
+        """Test that a body without an operations list is a 400 and changes nothing."""
+        response = self.client.post(reverse('update_lists'), 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(TBR.objects.filter(user=self.user).count(), 1)
+
+
+class ListMembershipTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="reader", password="12345")
+        self.client.login(username="reader", password="12345")
+        Category.objects.get_or_create(name="Fantasy")
+        self.books = [
+            Book.objects.create(title=f"Book {number}", author="Author", category="Fantasy",
+                                cover_image="books/covers/b.jpg")
+            for number in range(3)
+        ]
+        TBR.objects.create(user=self.user, book=self.books[0])
+        SkippedBooks.objects.create(user=self.user, book=self.books[1])
+        cache.clear()
+
+    def test_membership_lookup(self):
+        """Test that the membership reports which list each book is on."""
+        membership = get_membership(self.user)
+        self.assertEqual([membership.status(book.id) for book in self.books], ['tbr', 'skipped', None])
+
+    def test_category_page_marks_and_hides_without_list_queries(self):
+        """Test that a category page reads the lists from the cache once it is warm."""
+        url = reverse('category_page', kwargs={'category_name': 'fantasy'})
+        self.client.get(url)
+        with self.assertNumQueries(5):  # session, user, versions for the validators, category, books
+            response = self.client.get(url)
+        self.assertContains(response, "On your TBR list")
+        self.assertContains(response, "Skipped")
+        with self.assertNumQueries(5):  # the lists are hidden by the books query itself
+            response = self.client.get(url, {'hide': 'triaged'})
+        self.assertEqual([book.title for book in response.context['books']], ["Book 2"])
+
+    def test_changes_invalidate_the_cache(self):
+        """Test that adding and removing books is reflected straight away."""
+        get_membership(self.user)
+        self.client.post(reverse('add_to_tbr', kwargs={'book_id': self.books[2].id}))
+        self.assertEqual(get_membership(self.user).status(self.books[2].id), 'tbr')
+        self.client.post(reverse('delete_from_tbr', kwargs={'book_id': self.books[2].id}))
+        self.assertIsNone(get_membership(self.user).status(self.books[2].id))
+        self.client.post(reverse('update_lists'), {'operations': [
+            {'op': 'move', 'from': 'tbr', 'to': 'skipped', 'book': self.books[0].id},
+        ]}, content_type='application/json')
+        self.assertEqual(get_membership(self.user).status(self.books[0].id), 'skipped')
+
+
+class NextBooksTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="reader", password="12345")
+        self.client.login(username="reader", password="12345")
+        self.books = [
+            Book.objects.create(title=f"Book {number}", author="Author", popularity_score=100 - number,
+                                category="Fantasy" if number % 2 else "Romance", cover_image="books/covers/b.jpg")
+            for number in range(7)
+        ]
+        TBR.objects.create(user=self.user, book=self.books[0])
+        SkippedBooks.objects.create(user=self.user, book=self.books[1])
+
+    def titles(self, **params):
+        response = self.client.get(reverse('next_books'), params)
+        return [book['title'] for book in response.json()['books']]
+
+    def test_queue_skips_triaged_books_and_carries_on(self):
+        """Test that each call continues after the last one and leaves out books already on a list."""
+        self.assertEqual(self.titles(limit=2), ["Book 2", "Book 3"])
+        self.assertEqual(self.titles(limit=2), ["Book 4", "Book 5"])
+        self.assertEqual(self.titles(limit=2), ["Book 6"])
+        # The queue starts over, without the book the user has since saved
+        TBR.objects.create(user=self.user, book=self.books[2])
+        self.assertEqual(self.titles(limit=2), ["Book 3", "Book 4"])
+
+    def test_category_filter_has_its_own_position(self):
+        """Test that a category queue only shows that category and keeps its own cursor."""
+        self.assertEqual(self.titles(category="Fantasy", limit=1), ["Book 3"])
+        self.assertEqual(self.titles(limit=1), ["Book 2"])
+        self.assertEqual(self.titles(category="Fantasy", limit=5), ["Book 5"])
+        self.assertEqual(self.titles(category="Fantasy", limit=5, reset=1), ["Book 3", "Book 5"])
+
+    def test_requires_login(self):
+        """Test that an anonymous user gets a 401 instead of a queue."""
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('next_books')).status_code, 401)
+
+
+class RecommenderTest(TestCase):
+
+    def setUp(self):
+        self.books = [
+            Book.objects.create(title=f"Book {number}", author="Author", cover_image="books/covers/b.jpg")
+            for number in range(5)
+        ]
+        self.readers = [User.objects.create_user(username=f"reader{number}", password="12345") for number in range(4)]
+        # Everyone who saves book 0 also saves book 1; book 2 is liked by different people
+        for reader in self.readers[:3]:
+            TBR.objects.create(user=reader, book=self.books[0])
+            TBR.objects.create(user=reader, book=self.books[1])
+        Review.objects.create(user=self.readers[3], book=self.books[2], review="Good", rating=5)
+        Review.objects.create(user=self.readers[3], book=self.books[3], review="Good", rating=5)
+        SkippedBooks.objects.create(user=self.readers[2], book=self.books[4])
+        self.user = User.objects.create_user(username="newcomer", password="12345")
+        TBR.objects.create(user=self.user, book=self.books[0])
+
+    def test_similar_books_and_recommendations(self):
+        """Test that books read together are similar and get recommended to a new reader."""
+        call_command('build_recommendations', '--full', stdout=StringIO())
+        similar = SimilarBook.objects.filter(book=self.books[0]).order_by('rank')
+        self.assertEqual(similar[0].similar, self.books[1])
+        self.assertNotIn(self.books[2].id, [row.similar_id for row in similar])
+
+        self.client.login(username="newcomer", password="12345")
+        with self.assertNumQueries(3):  # session, user, recommendations
+            books = self.client.get(reverse('recommendations')).json()['books']
+        self.assertEqual([book['id'] for book in books], [self.books[1].id])
+
+    def test_incremental_refresh_only_touches_new_feedback(self):
+        """Test that an incremental run refreshes the new feedback's book, its list's books and their readers."""
+        call_command('build_recommendations', '--full', stdout=StringIO())
+        latecomer = User.objects.create_user(username="latecomer", password="12345")
+        Review.objects.create(user=latecomer, book=self.books[2], review="Great", rating=4)
+        out = StringIO()
+        call_command('build_recommendations', stdout=out)
+        self.assertIn("for 2 books and 2 users", out.getvalue())  # books 2 and 3, latecomer and reader3
+        self.assertEqual(list(Recommendation.objects.filter(user=latecomer).values_list('book_id', flat=True)),
+                         [self.books[3].id])
+
+    def test_incremental_refresh_updates_co_rated_books(self):
+        """Test that new feedback refreshes the lists of the other books the same user has feedback on."""
+        call_command('build_recommendations', '--full', stdout=StringIO())
+        self.assertFalse(SimilarBook.objects.filter(book=self.books[0], similar=self.books[3]).exists())
+        TBR.objects.create(user=self.user, book=self.books[3])
+        call_command('build_recommendations', stdout=StringIO())
+        self.assertTrue(SimilarBook.objects.filter(book=self.books[0], similar=self.books[3]).exists())
+
+    def test_saved_books_drop_out_of_recommendations(self):
+        """Test that a recommended book disappears once the user saves it."""
+        call_command('build_recommendations', '--full', stdout=StringIO())
+        TBR.objects.create(user=self.user, book=self.books[1])
+        self.client.login(username="newcomer", password="12345")
+        self.assertEqual(self.client.get(reverse('recommendations')).json()['books'], [])
+
+
+class TrendingTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="reader", password="12345")
+        self.books = [
+            Book.objects.create(title=f"Book {number}", author="Author", category="Fantasy" if number < 3 else "Romance",
+                                cover_image="books/covers/b.jpg")
+            for number in range(5)
+        ]
+
+    def test_recent_activity_outweighs_old_activity(self):
+        """Test that a save from today scores higher than two from a month ago."""
+        now = timezone.now()
+        readers = [User.objects.create(username=f"old{number}") for number in range(2)]
+        for reader in readers:
+            entry = TBR.objects.create(user=reader, book=self.books[0])
+            TBR.objects.filter(id=entry.id).update(added_on=now - timedelta(days=30))
+        TBR.objects.create(user=self.user, book=self.books[1])
+        self.assertEqual(update_trending(now=now + timedelta(seconds=1)), 2)
+        scores = dict(Book.objects.values_list('id', 'popularity_score'))
+        self.assertGreater(scores[self.books[0].id], 0)
+        self.assertGreater(scores[self.books[1].id], scores[self.books[0].id])
+
+    def test_runs_are_incremental(self):
+        """Test that a second run only adds the events since the first."""
+        TBR.objects.create(user=self.user, book=self.books[2])
+        update_trending()
+        first = Book.objects.get(id=self.books[2].id).popularity_score
+        self.assertEqual(update_trending(), 0)
+        self.assertEqual(Book.objects.get(id=self.books[2].id).popularity_score, first)
+        Review.objects.create(user=self.user, book=self.books[3], review="Good", rating=4)
+        self.assertEqual(update_trending(), 1)
+
+    def test_home_page_shows_top_books_per_category(self):
+        """Test that the home page lists each category's most popular books from one cached query."""
+        TBR.objects.create(user=self.user, book=self.books[2])
+        SkippedBooks.objects.create(user=self.user, book=self.books[4])
+        update_trending()
+        self.client.login(username="reader", password="12345")
+        self.client.get(reverse('home'))
+        with self.assertNumQueries(4):  # catalog and trending versions, session, user, recommendations
+            response = self.client.get(reverse('home'))
+        trending = response.context['trending']
+        self.assertEqual(list(trending), ['Fantasy', 'Romance'])
+        self.assertEqual(trending['Fantasy'][0]['title'], "Book 2")
+        self.assertEqual(trending['Romance'][-1]['title'], "Book 4")
+
+    def test_runs_only_invalidate_what_is_ranked_by_popularity(self):
+        """Test that a run leaves the catalog version alone but refreshes popularity-sorted pages and suggestions."""
+        Category.objects.get_or_create(name="Fantasy")
+        self.client.login(username="reader", password="12345")
+        by_title = reverse('category_page', kwargs={'category_name': 'fantasy'})
+        by_popularity = by_title + '?sort=popularity'
+        suggest_url = reverse('search_suggest') + '?q=book'
+        etags = {url: self.client.get(url)['ETag'] for url in (by_title, by_popularity, suggest_url)}
+        version = catalog_version()
+
+        TBR.objects.create(user=User.objects.create(username="fan"), book=self.books[2])
+        update_trending()
+        self.assertEqual(catalog_version(), version)
+        self.assertEqual(self.client.get(by_title, HTTP_IF_NONE_MATCH=etags[by_title]).status_code, 304)
+        self.assertEqual(self.client.get(by_popularity, HTTP_IF_NONE_MATCH=etags[by_popularity]).status_code, 200)
+        response = self.client.get(suggest_url, HTTP_IF_NONE_MATCH=etags[suggest_url])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['title'], "Book 2")
+
+
+class RelatedBooksTest(TestCase):
+
+    def setUp(self):
+        descriptions = [
+            "A young wizard attends a school of magic and battles a dark lord",
+            "A school of magic where a wizard apprentice faces a dark sorcerer",
+            "A detective hunts a serial killer through the foggy streets of London",
+            "A London detective investigates a killer who leaves riddles",
+            "A romance between a baker and a fisherman in a seaside town",
+        ]
+        self.books = [
+            Book.objects.create(title=f"Book {number}", author="Author", description=description,
+                                cover_image="books/covers/b.jpg")
+            for number, description in enumerate(descriptions)
+        ]
+
+    def related_to(self, book):
+        return list(RelatedBook.objects.filter(book=book).order_by('rank').values_list('related_id', flat=True))
+
+    def test_books_with_alike_descriptions_are_related(self):
+        """Test that each book's closest match is the one with the most similar description."""
+        call_command('build_related_books', stdout=StringIO())
+        self.assertEqual(self.related_to(self.books[0])[0], self.books[1].id)
+        self.assertEqual(self.related_to(self.books[2])[0], self.books[3].id)
+        self.assertNotIn(self.books[2].id, self.related_to(self.books[0]))
+
+        self.client.force_login(User.objects.create_user(username="reader", password="12345"))
+        unbuilt = Book.objects.create(title="New Book", author="Author", cover_image="books/covers/b.jpg")
+        response = self.client.get(reverse('book_detail', kwargs={'book_id': unbuilt.id}))
+        self.assertEqual(response.context['related_books'], [])
+
+    def test_blocks_are_bounded_by_posting_volume(self):
+        """Test that scoring blocks stay under BLOCK_POSTINGS postings and give the same lists as one block."""
+        call_command('build_related_books', stdout=StringIO())
+        expected = {book.id: self.related_to(book) for book in self.books}
+        vectors = DescriptionVectors([(book.id, book.description) for book in self.books])
+        self.assertTrue(vectors.query_postings.any())
+        with mock.patch('ROS_App.related.BLOCK_POSTINGS', int(vectors.query_postings.max())):
+            blocks = list(vectors.blocks(range(len(vectors))))
+            self.assertGreater(len(blocks), 1)
+            for block in blocks:
+                self.assertLessEqual(vectors.query_postings[block].sum(), vectors.query_postings.max())
+            call_command('build_related_books', full=True, stdout=StringIO())
+        self.assertEqual({book.id: self.related_to(book) for book in self.books}, expected)
+
+    def test_scores_are_bounded_by_term_postings(self):
+        """Test that each query term only reaches the TERM_POSTINGS books that weigh it most."""
+        with mock.patch('ROS_App.related.TERM_POSTINGS', 1):
+            vectors = DescriptionVectors([(book.id, book.description) for book in self.books])
+            block = list(range(len(vectors)))
+            rows, _, _ = vectors.scores(block)
+            _, lengths = vectors.query_terms(block)
+        self.assertTrue(lengths.any())
+        self.assertEqual(vectors.query_postings.tolist(), lengths.tolist())
+        for row, length in enumerate(lengths):
+            self.assertLessEqual((rows == row).sum(), length)
+
+    def test_incremental_run_only_redoes_affected_books(self):
+        """Test that changing one description refreshes that book and the lists it joins or leaves."""
+        call_command('build_related_books', stdout=StringIO())
+        Book.objects.filter(id=self.books[4].id).update(
+            description="A detective and a baker solve a killer's riddles in London")
+        out = StringIO()
+        call_command('build_related_books', stdout=out)
+        self.assertNotIn("for 5 books", out.getvalue())
+        self.assertIn(self.books[4].id, self.related_to(self.books[3]))
+        self.assertEqual(self.related_to(self.books[4])[0], self.books[3].id)
+
+
+class CoverThumbnailTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def image_file(self, name, size=(1000, 1500), colour=(120, 30, 60)):
+        buffer = BytesIO()
+        Image.new('RGB', size, colour).save(buffer, 'JPEG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+    def test_upload_generates_every_size_and_format(self):
+        """Test that uploading a cover writes each thumbnail size in WebP and JPEG."""
+        book = Book.objects.create(title="Dune", author="Frank Herbert", cover_image=self.image_file('dune.jpg'))
+        for size, box in SIZES.items():
+            for ext in FORMATS:
+                with Image.open(os.path.join(self.media_root, variant_name(book.cover_image.name, size, ext))) as image:
+                    self.assertLessEqual(image.size, box)
+        with Image.open(os.path.join(self.media_root, variant_name(book.cover_image.name, 'grid', 'jpg'))) as image:
+            self.assertEqual(image.size, (200, 300))
+
+    def test_cover_tag_is_responsive_with_a_placeholder(self):
+        """Test that the cover tag lists every size, sets dimensions and inlines a placeholder."""
+        book = Book.objects.create(title="Dune", author="Frank Herbert", cover_image=self.image_file('dune.jpg'))
+        stem = cover_stem(book.cover_image.name)
+        html = Template("{% load customFilters %}{% cover name 'grid' 'Dune' %}").render(
+            Context({'name': book.cover_image.name}))
+        self.assertIn(f'type="image/webp" srcset="/media/covers/grid/{stem}.webp 200w, '
+                      f'/media/covers/detail/{stem}.webp 400w, /media/covers/retina/{stem}.webp 800w"', html)
+        self.assertIn(f'src="/media/covers/grid/{stem}.jpg"', html)
+        self.assertIn('width="200" height="300"', html)
+        self.assertIn('loading="lazy"', html)
+        placeholder = re.search(r'url\(data:image/webp;base64,([^)]+)\)', html).group(1)
+        self.assertLess(len(placeholder), 400)
+        with Image.open(BytesIO(base64.b64decode(placeholder))) as image:
+            self.assertLessEqual(image.size, (12, 18))
+
+        html = Template("{% load customFilters %}{% cover name 'detail' 'Dune' lazy=False %}").render(
+            Context({'name': book.cover_image.name}))
+        self.assertIn('width="400" height="600"', html)
+        self.assertIn('loading="eager"', html)
+
+    def test_missing_thumbnails_fall_back_to_the_original(self):
+        """Test that a cover without thumbnails is served from static/images."""
+        html = Template("{% load customFilters %}{% cover '21Romeo.jpg' 'grid' 'Romeo' %}").render(Context())
+        self.assertIn(f'src="{static("images/21Romeo.jpg")}"', html)
+
+    def test_bulk_generation_uses_a_process_pool_and_skips_fresh_files(self):
+        """Test that build_covers resizes many covers once and leaves up-to-date ones alone."""
+        for number in range(3):
+            Book.objects.create(title=f"Book {number}", author="Author",
+                                cover_image=self.image_file(f'book{number}.jpg', size=(300, 450), colour=(number * 80, 0, 0)))
+        shutil.rmtree(os.path.join(self.media_root, 'covers'))
+        out = StringIO()
+        call_command('build_covers', workers=2, stdout=out, stderr=StringIO())
+        self.assertIn(f"written: {3 * len(SIZES) * len(FORMATS)}", out.getvalue())
+        out = StringIO()
+        call_command('build_covers', workers=2, stdout=out, stderr=StringIO())
+        self.assertIn("written: 0", out.getvalue())
+
+
+class ContentAddressedCoverTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        buffer = BytesIO()
+        Image.new('RGB', (60, 90), (10, 80, 40)).save(buffer, 'JPEG')
+        self.image = buffer.getvalue()
+
+    def upload(self, title, name):
+        return Book.objects.create(title=title, author="Author",
+                                   cover_image=SimpleUploadedFile(name, self.image, content_type='image/jpeg'))
+
+    def test_identical_uploads_share_one_file(self):
+        """Test that the same image uploaded twice is stored once, under its hash."""
+        first = self.upload("First", "cover.jpg")
+        second = self.upload("Second", "COVER copy.JPG")
+        self.assertEqual(first.cover_image.name, second.cover_image.name)
+        self.assertRegex(first.cover_image.name, r'^books/covers/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        stored = [files for _, _, files in os.walk(os.path.join(self.media_root, 'books'))]
+        self.assertEqual(sum(len(files) for files in stored), 1)
+
+    def test_file_is_deleted_with_its_last_book(self):
+        """Test that a shared cover survives until the last book using it is deleted."""
+        first = self.upload("First", "cover.jpg")
+        second = self.upload("Second", "cover.jpg")
+        path = first.cover_image.path
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_listings_link_the_stored_cover(self):
+        """Test that listings pass the full stored name, so a cover without thumbnails falls back to the upload."""
+        book = self.upload("Dragon Days", "cover.jpg")
+        self.upload("Dragon Nights", "cover.jpg")
+        Book.objects.update(category="Fantasy")
+        Category.objects.get_or_create(name="Fantasy")
+        self.client.force_login(User.objects.create_user(username="reader", password="12345"))
+        response = self.client.get(reverse('category_page', kwargs={'category_name': 'fantasy'}))
+        self.assertContains(response, 'srcset=')
+
+        shutil.rmtree(os.path.join(self.media_root, 'covers'))
+        for url in (reverse('category_page', kwargs={'category_name': 'fantasy'}),
+                    reverse('search_books') + '?q=dragon'):
+            self.assertContains(self.client.get(url), f'src="{settings.MEDIA_URL}{book.cover_image.name}"')
+
+    def test_dedupe_command_merges_legacy_copies(self):
+        """Test that dedupe_covers points books at one stored copy and deletes the rest."""
+        covers = os.path.join(self.media_root, 'books', 'covers')
+        os.makedirs(covers)
+        for filename in ('dune.jpg', 'dune_aB3xYz9.jpg', 'orphan.jpg'):
+            with open(os.path.join(covers, filename), 'wb') as file:
+                file.write(self.image)
+        Book.objects.create(title="Dune", author="Frank Herbert", cover_image="books/covers/dune.jpg")
+        Book.objects.create(title="Dune again", author="Frank Herbert", cover_image="books/covers/dune_aB3xYz9.jpg")
+
+        out = StringIO()
+        call_command('dedupe_covers', stdout=out)
+        self.assertIn("Moved 2 covers", out.getvalue())
+        self.assertIn("deleted 3 unused files", out.getvalue())
+        names = set(Book.objects.values_list('cover_image', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, name)))
+        self.assertIsNotNone(cover_info(name))  # thumbnails of the moved cover
+        self.assertEqual(os.listdir(covers), [os.listdir(covers)[0]])  # only the hash directory is left
+
+
+class StaticFilesTest(TestCase):
+
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root)
+        settings_override = override_settings(STATIC_ROOT=self.static_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def test_collectstatic_hashes_and_compresses(self):
+        """Test that collected files get hashed names, rewritten references and .gz copies of text files."""
+        url = static('CSS/home.css')
+        self.assertRegex(url, r'^/static/CSS/home\.[0-9a-f]{12}\.css$')
+        with open(os.path.join(self.static_root, url[len('/static/'):])) as file:
+            self.assertRegex(file.read(), r'/static/images/fantasy_button\.[0-9a-f]{12}\.jpeg')
+        self.assertTrue(os.path.exists(os.path.join(self.static_root, url[len('/static/'):] + '.gz')))
+        self.assertFalse(os.path.exists(os.path.join(self.static_root, 'images', 'fantasy_button.jpeg.gz')))
+
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, url)
+
+    def test_hashed_files_are_immutable_and_gzipped_on_request(self):
+        """Test that hashed files are cached forever and sent gzipped only to clients that accept it."""
+        url = static('CSS/base.css')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertIn(b'body', gzip.decompress(b''.join(response.streaming_content)))
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn(b'body', b''.join(response.streaming_content))
+
+    def test_plain_names_are_revalidated(self):
+        """Test that unhashed names must be revalidated and answer 304 when unchanged."""
+        response = self.client.get('/static/CSS/base.css')
+        self.assertNotIn('immutable', response['Cache-Control'])
+        response.close()
+        response = self.client.get('/static/CSS/base.css', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+
+class ConditionalGetTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="reader", password="12345")
+        self.client.login(username="reader", password="12345")
+        Category.objects.get_or_create(name="Fantasy")
+        self.book = Book.objects.create(title="Book", author="Author", category="Fantasy",
+                                        cover_image="books/covers/b.jpg")
+        self.book_id = self.book.id
+        self.url = reverse('book_detail', kwargs={'book_id': self.book_id})
+
+    def test_unchanged_book_page_is_not_modified(self):
+        """Test that a repeat request with the ETag gets a 304 without rendering the page."""
+        self.client.get(self.url)  # sets the CSRF cookie, which the ETag covers
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('private', response['Cache-Control'])
+        etag = response['ETag']
+
+        with self.assertNumQueries(4):  # session, user, book, versions
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_reviews_lists_and_user_change_the_etag(self):
+        """Test that a new review, a list change or another user each get the full page."""
+        self.client.get(self.url)
+        etag = self.client.get(self.url)['ETag']
+        Review.objects.create(user=self.user, book=self.book, review="Great", rating=5)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Great")
+
+        etag = response['ETag']
+        self.client.post(reverse('add_to_tbr', kwargs={'book_id': self.book_id}))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response['ETag']
+        User.objects.create_user(username="other", password="12345")
+        self.client.login(username="other", password="12345")
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_validators_are_shared_between_processes(self):
+        """Test that a worker with its own cache computes the same ETag, and sees another process's writes."""
+        self.client.get(self.url)
+        etag = self.client.get(self.url)['ETag']
+        cache.clear()  # what another process, with its own cache, sees
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # A write that only the database sees, as from another process
+        add_to_list(TBR, self.user.id, self.book_id)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['list_status'], 'tbr')
+
+    def test_category_and_search_follow_the_catalog(self):
+        """Test that category and search pages are 304 until a book changes."""
+        Book.objects.create(title="Dragon Days", author="Author", category="Fantasy", cover_image="books/covers/b.jpg")
+        self.book.title = "Dragon Nights"
+        self.book.save()
+        for number, url in enumerate([reverse('category_page', kwargs={'category_name': 'fantasy'}) + '?sort=rating',
+                                      reverse('search_books') + '?q=dragon']):
+            etag = self.client.get(url)['ETag']
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.book.title = f"Dragon Nights {number}"
+            self.book.save()
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        # Sorted by rating, a new review can reorder the page
+        url = reverse('category_page', kwargs={'category_name': 'fantasy'}) + '?sort=rating'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(3):  # session, user, versions; no scan of the category
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Review.objects.create(user=self.user, book=self.book, review="Great", rating=5)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
@@ -0,0 +1,110 @@
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Value, When, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .catalog import CATALOG_VERSION, bump_version, version_stamps
+from .importer import batched
+from .models import Book, Review, SkippedBooks, TBR, TrendingState
+
+
+# A TBR add, skip or review counts half as much after this long
+HALF_LIFE = timedelta(days=7)
+DECAY_RATE = math.log(2) / HALF_LIFE.total_seconds()
+
+TBR_WEIGHT = 1.0
+SKIP_WEIGHT = -0.5
+REVIEW_WEIGHT = 2.0
+
+# How far the landmark may fall behind before scores are rescaled to a new one
+REBASE_AFTER = HALF_LIFE * 4
+
+TRENDING_PER_CATEGORY = 4
+
+# DataVersion row bumped by every run that changes popularity scores. Only
+# what is ranked by popularity follows it, not the catalog version.
+TRENDING_VERSION = 'trending'
+UPDATE_BATCH_SIZE = 500
+
+
+def event_weight(weight, when, landmark):
+    """
+    Forward decay: an event's weight grows with how far after the landmark it
+    happened. Every book's score shares the same decay since the landmark, so
+    ranking by the stored score equals ranking by the decayed one, and a run
+    only writes the books that had new events.
+    """
+    return weight * math.exp(DECAY_RATE * (when - landmark).total_seconds())
+
+
+def collect_events(since, until, landmark):
+    """{book id: added score} for the events in (since, until]."""
+    scores = {}
+    sources = (
+        (TBR.objects, 'added_on', TBR_WEIGHT),
+        (SkippedBooks.objects, 'added_on', SKIP_WEIGHT),
+        (Review.objects, 'created_at', REVIEW_WEIGHT),
+    )
+    for manager, field, weight in sources:
+        events = manager.filter(**{f'{field}__gt': since, f'{field}__lte': until}).values_list('book_id', field)
+        for book_id, when in events.iterator(chunk_size=5000):
+            scores[book_id] = scores.get(book_id, 0.0) + event_weight(weight, when, landmark)
+    return scores
+
+
+def update_trending(now=None):
+    """
+    Adds the events since the last run to Book.popularity_score. Run it on a
+    schedule (`manage.py update_trending`), never per request. Returns the
+    number of books whose score changed.
+    """
+    now = now or timezone.now()
+    state = TrendingState.objects.first()
+    if state is None:
+        # First run: count all history, with the landmark at now
+        state = TrendingState(landmark=now, updated_until=datetime(1970, 1, 1, tzinfo=dt_timezone.utc))
+
+    with transaction.atomic():
+        rebased = now - state.landmark > REBASE_AFTER
+        if rebased:
+            # One full-table rescale so scores stay in a comfortable float range
+            factor = math.exp(-DECAY_RATE * (now - state.landmark).total_seconds())
+            Book.objects.update(popularity_score=F('popularity_score') * factor)
+            state.landmark = now
+
+        scores = collect_events(state.updated_until, now, state.landmark)
+        for batch in batched(scores.items(), UPDATE_BATCH_SIZE):
+            Book.objects.filter(id__in=[book_id for book_id, _ in batch]).update(popularity_score=Case(
+                *[When(id=book_id, then=F('popularity_score') + Value(score)) for book_id, score in batch],
+                output_field=FloatField(),
+            ))
+        state.updated_until = now
+        state.save()
+        if scores or rebased:
+            bump_version(TRENDING_VERSION)
+    return len(scores)
+
+
+def trending_query(per_category=TRENDING_PER_CATEGORY):
+    """The top books of every category in one query, walking book_category_popular_idx."""
+    rank = Window(RowNumber(), partition_by=[F('category')], order_by=[F('popularity_score').desc(), F('id')])
+    return Book.objects.exclude(category__isnull=True).exclude(category='').annotate(rank=rank).filter(
+        rank__lte=per_category).values('id', 'title', 'author', 'category', 'cover_image').order_by('category', 'rank')
+
+
+def trending_by_category(per_category=TRENDING_PER_CATEGORY):
+    """{category: [book dicts]}, cached until the catalog or the scores next change."""
+    stamps = version_stamps([CATALOG_VERSION, TRENDING_VERSION])
+    key = f'ROS_App:trending:{stamps[CATALOG_VERSION][0]}:{stamps[TRENDING_VERSION][0]}:{per_category}'
+    trending = cache.get(key)
+    if trending is None:
+        trending = {}
+        for row in trending_query(per_category):
+            cover = row.pop('cover_image')
+            trending.setdefault(row['category'], []).append({**row, 'cover': cover})
+        cache.set(key, trending)
+    return trending
@@ -13,8 +13,12 @@ urlpatterns = [
     path('contactUs/', views.contactUs_view, name='contactUs'),
     path('myAccount/',views.myAccount_view, name="myAccount"),
     path('book/<int:book_id>/', views.book_detail, name='book_detail'),
+    path('book/<int:book_id>/reviews/', views.book_reviews, name='book_reviews'),
     path('book/<int:book_id>/add_to_tbr/', views.add_to_tbr, name='add_to_tbr'),
     path('tbr/', views.tbr_list, name='tbr_list'),
+    path('lists/batch/', views.update_lists, name='update_lists'),
+    path('next-books/', views.next_books, name='next_books'),
+    path('recommendations/', views.recommendations, name='recommendations'),
     path('book/<int:book_id>/add_to_skipped/', views.add_to_Skipped, name='add_to_skipped'),
     path('skipped-books/', views.SkippedBooks_list, name='skipped_book_list'),
     path('book/<int:book_id>/delete_from_skipped/', views.delete_from_Skipped, name='delete_from_skipped'),
@@ -25,12 +29,9 @@ urlpatterns = [
     path("myAccount/update-account/", views.update_account_view, name="update_account"),
     path("myAccount/delete-account/", views.confirm_delete_account, name="confirm_delete"),
     path("myAccount/delete-account/confirm-delete/", views.delete_account, name="delete_account"),
-    path('categories/fantasy/', views.fantasy_view, name='fantasy'),
-    path('categories/thriller/', views.thriller_view, name='thriller'),
-    path('categories/romance/', views.romance_view, name='romance'),
-    path('categories/classics/', views.classics_view, name='classics'),
-    path('categories/<str:category_name>/', views.categories_view, name='category_page'),
+    path('categories/<str:category_name>/', views.category_view, name='category_page'),
     path('book/<int:book_id>/add_to_tbr/', views.book_detail, name='add_to_tbr'),
     path('contact/', views.contactUs_view,name='contact'),
     path('search/', views.search_books, name='search_books'),
+    path('search/suggest/', views.search_suggest, name='search_suggest'),
     ]
@@ -1,122 +1,333 @@
+import hashlib
+import json
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+
 from django.shortcuts import render, redirect, get_object_or_404
-from .models import Book, Review, TBR, SkippedBooks
+from .models import Book, Recommendation, RelatedBook, Review, TBR, SkippedBooks
 from .forms import ReviewForm, UpdateAccountForm
-from django.db import models 
+from django.db.models import Exists, OuterRef
 from django.contrib.auth.models import User  
 from django.contrib import messages  
 from django.contrib.auth import authenticate, login, update_session_auth_hash, logout
 from django.contrib.auth.decorators import login_required
 from .models import Category
+from .catalog import CATALOG_VERSION, version_stamps
+from .importer import NO_DESCRIPTION
+from .lists import MAX_BATCH_OPERATIONS, add_to_list, apply_operations, lists_version, remove_from_list, request_membership
+from .search import SearchResults
+from .fuzzy import fuzzy_search
+from .suggest import suggest
+from .trending import TRENDING_VERSION, trending_by_category
+from .pagination import keyset_page
+from .ratings import RATINGS_VERSION
+from .related import RELATED_VERSION
+from django.core.paginator import Paginator
 from django.http import JsonResponse
-import os
-import csv
-from django.conf import settings
-from django.core.files.storage import FileSystemStorage
-from django.shortcuts import render
 from django.http import Http404
-
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_POST
+
+SEARCH_RESULTS_PER_PAGE = 20
+CATEGORY_PAGE_SIZE = 24
+
+# Keyset orderings for category listings; each ends in 'id' so ties are stable
+CATEGORY_SORTS = {
+    'title': ['title', 'id'],
+    'popularity': ['-popularity_score', 'id'],
+    'rating': ['-rating_average', 'id'],
+}
+
+REVIEWS_PER_PAGE = 10
+# Newest first; id breaks ties between reviews saved in the same instant
+REVIEW_ORDERING = ['-created_at', '-id']
+
+SAVED_BOOKS_PER_PAGE = 24
+# Orderings for the TBR and Skipped lists
+SAVED_BOOK_SORTS = {
+    'newest': ['-added_on', '-id'],
+    'oldest': ['added_on', 'id'],
+    'title': ['book__title', 'id'],
+}
+
+HOME_RECOMMENDATIONS = 4
+RELATED_BOOKS = 6
+MAX_RECOMMENDATIONS = 50
+
+# The read-or-skip queue
+SWIPE_BATCH_SIZE = 10
+MAX_SWIPE_BATCH_SIZE = 50
+SWIPE_ORDERING = ['-popularity_score', 'id']
+
+# Categories with their own colour scheme in static/CSS
+THEMED_CATEGORIES = {'fantasy', 'thriller', 'romance', 'classics'}
+SUGGEST_MAX_AGE = 300
 
 
 def home_view(request):
-    trending_books = [
-        {'title': 'Romeo and Juliet', 'author': 'Willian Shakespeare', 'cover': '21Romeo.jpg', 'id': 21},
-        {'title': 'The Midnight Library', 'author': 'Matt Haig', 'cover': '49Mid.jpg', 'id': 49},
-        {'title': 'Lord of the Rings', 'author': 'J.R.R. Tolkien', 'cover': '58LOTR1.jpg', 'id': 58},
-        {'title': 'It Ends With Us', 'author': 'Collen Hoover', 'cover':'11EndsUs.jpg','id': 11},
-    ]
-    categories = ['Fantasy', 'Classics', 'Thriller', 'Romance']
+    # Precomputed by `manage.py update_trending`; cached until the catalog or the scores change
+    trending = trending_by_category()
 
     context = {
-        'trending_books': trending_books,
-        'categories': categories,
+        'trending': trending,
+        'recommended_books': recommended_books(request.user, HOME_RECOMMENDATIONS),
     }
     return render(request, 'ROS_App/home.html', context)
 
 
-def categories_view(request):
-    categories = Category.objects.all()  
-    return render(request, 'ROS_App/categories.html', {'categories': categories})
+def recommended_books(user, limit):
+    """The user's precomputed recommendations, minus books they have saved or skipped since."""
+    if not user.is_authenticated:
+        return []
+    recommendations = Recommendation.objects.filter(user=user).exclude(
+        Exists(TBR.objects.filter(user=user, book=OuterRef('book')))
+    ).exclude(
+        Exists(SkippedBooks.objects.filter(user=user, book=OuterRef('book')))
+    ).select_related('book').only(
+        'score', 'book__id', 'book__title', 'book__author', 'book__cover_image').order_by('rank')
+    return [{
+        'id': recommendation.book.id,
+        'title': recommendation.book.title,
+        'author': recommendation.book.author,
+        'cover': recommendation.book.cover_image.name,
+        'score': recommendation.score,
+    } for recommendation in recommendations[:limit]]
+
+
+def recommendations(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({'success': False, 'message': 'You need to be logged in to get recommendations.'}, status=401)
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), MAX_RECOMMENDATIONS)
+    except ValueError:
+        limit = 10
+    return JsonResponse({'books': recommended_books(request.user, limit)})
+
+
+# Conditional GETs. A page's ETag hashes the versions of everything it shows:
+# the catalog, the user's lists, who the user is and their CSRF secret (pages
+# embed tokens derived from it), plus whatever the page adds. Last-Modified is
+# the newest of the matching change times. The versions are DataVersion rows,
+# so every worker computes the same validators.
+
+def request_stamps(request):
+    """
+    (token, Unix time) of the catalog, related-books, trending, ratings and,
+    for a logged-in user, lists versions, read in one query at most once per
+    request.
+    """
+    if not hasattr(request, '_version_stamps'):
+        names = {'catalog': CATALOG_VERSION, 'related': RELATED_VERSION, 'trending': TRENDING_VERSION,
+                 'ratings': RATINGS_VERSION}
+        if request.user.is_authenticated:
+            names['lists'] = lists_version(request.user.id)
+        stamps = version_stamps(names.values())
+        request._version_stamps = {key: stamps[name] for key, name in names.items()}
+    return request._version_stamps
+
+
+def list_membership(request):
+    """The user's lists, cached under the lists version the validators read."""
+    lists = request_stamps(request).get('lists')
+    return request_membership(request, lists[0] if lists else None)
+
+
+def page_etag(request, *parts):
+    user = request.user
+    stamps = request_stamps(request)
+    lists = stamps['lists'][0] if user.is_authenticated else ''
+    csrf_secret = request.META.get('CSRF_COOKIE', '')
+    key = '|'.join(str(part) for part in (stamps['catalog'][0], user.pk, lists, csrf_secret) + parts)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def page_last_modified(request, *times):
+    user = request.user
+    stamps = request_stamps(request)
+    times = [stamps['catalog'][1], *(time for time in times if time is not None)]
+    if user.is_authenticated:
+        times.append(stamps['lists'][1])
+        if user.last_login:
+            times.append(user.last_login.timestamp())
+    return datetime.fromtimestamp(max(times), tz=dt_timezone.utc)
+
+
+def private_revalidate(view):
+    """Lets browsers keep a page but makes them check it with the ETag first."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            patch_cache_control(response, no_cache=True, private=request.user.is_authenticated)
+        return response
+    return wrapper
+
+
+# Versions that reorder a category page, by sort; title order only follows the catalog
+CATEGORY_SORT_VERSIONS = {'popularity': 'trending', 'rating': 'ratings'}
+
+
+def category_order_changed(request):
+    """(token, Unix time) of the version that reorders the page's sort, or (None, None)."""
+    version = CATEGORY_SORT_VERSIONS.get(request.GET.get('sort'))
+    return request_stamps(request)[version] if version else (None, None)
+
+
+def category_etag(request, category_name):
+    return page_etag(request, category_order_changed(request)[0])
+
+
+def category_last_modified(request, category_name):
+    return page_last_modified(request, category_order_changed(request)[1])
+
+
+@private_revalidate
+@condition(etag_func=category_etag, last_modified_func=category_last_modified)
+def category_view(request, category_name):
+    # Any category in the catalog, matched case-insensitively against the URL
+    category = Category.objects.filter(name__iexact=category_name).values_list('name', flat=True).first()
+    if category is None:
+        raise Http404("Category not found")
+
+    sort = request.GET.get('sort')
+    if sort not in CATEGORY_SORTS:
+        sort = 'title'
+
+    books = Book.objects.filter(category=category).only(
+        'id', 'title', 'author', 'cover_image', 'popularity_score', 'rating_average')
+    membership = list_membership(request)
+    hide_triaged = request.GET.get('hide') == 'triaged'
+    if hide_triaged and request.user.is_authenticated:
+        books = books.exclude(
+            Exists(TBR.objects.filter(user=request.user, book=OuterRef('pk')))
+        ).exclude(
+            Exists(SkippedBooks.objects.filter(user=request.user, book=OuterRef('pk')))
+        )
+    page = keyset_page(books, CATEGORY_SORTS[sort], request.GET.get('after'), CATEGORY_PAGE_SIZE)
+
+    slug = category.lower()
+    return render(request, 'ROS_App/category.html', {
+        'category': category,
+        'slug': slug,
+        'stylesheet': f'CSS/{slug}.css' if slug in THEMED_CATEGORIES else 'CSS/fantasy.css',
+        'books': page,
+        'sort': sort,
+        'sorts': list(CATEGORY_SORTS),
+        'membership': membership,
+        'hide_triaged': hide_triaged,
+    })
+
+
+def request_book(request, book_id):
+    """The book's row, loaded at most once per request. Raises Http404 if there is none."""
+    if not hasattr(request, '_book'):
+        request._book = get_object_or_404(Book, pk=book_id)
+    return request._book
+
+
+def book_reviews_changed(request, book_id):
+    changed = request_book(request, book_id).reviews_changed_at
+    return changed.timestamp() if changed else None
+
+
+def book_detail_etag(request, book_id):
+    return page_etag(request, book_id, book_reviews_changed(request, book_id), request_stamps(request)['related'][0])
+
+
+def book_detail_last_modified(request, book_id):
+    return page_last_modified(request, book_reviews_changed(request, book_id), request_stamps(request)['related'][1])
+
 
 @login_required
+@private_revalidate
+@condition(etag_func=book_detail_etag, last_modified_func=book_detail_last_modified)
 def book_detail(request, book_id):
-    all_books_by_category = load_books_from_csv()
-    all_books = sum(all_books_by_category.values(), [])
-
-# search for book in csv    
-    book = next((b for b in all_books if int(b['id']) == book_id), None)
-    if not book:
-        raise Http404("Book not found")
-    
-# default
-    book_description = book.get('description')
-    if not book_description:
-        book_description = 'no description available'
-
-    # Get or create a database Book instance for reviews
-    db_book, created = Book.objects.get_or_create(
-        id=book_id,
-        defaults={
-            'title': book['title'],
-            'author': book['author'],
-            'description': book_description,
-            'cover_image': f"books/covers/{book['cover']}"
-        }
-    )
-
-    if not created:
-        updated = False
-        if not db_book.description or db_book.description.strip() == "":
-            db_book.description = book_description
-            updated = True
-        if not db_book.cover_image or db_book.cover_image.name == "images/dracula.jpg":
-            db_book.cover_image = f"books/covers/{book['cover']}"
-            updated = True
-        if updated:
-            db_book.save()
+    book = request_book(request, book_id)
 
     if request.method == 'POST':
         form = ReviewForm(request.POST)
         if form.is_valid():
             review = form.save(commit=False)
             review.user = request.user
-            review.book = db_book
+            review.book = book
             review.save()
             return redirect('book_detail', book_id=book_id)
     else:
         form = ReviewForm()
 
-    reviews = Review.objects.filter(book=db_book)
-    average_rating = reviews.aggregate(models.Avg('rating'))['rating__avg'] or 0
+    reviews = review_feed(book_id, request.GET.get('after'))
 
     return render(request, 'books/book_detail.html', {
-        'book': {**book, 'id': db_book.id, 'description': book_description},
+        'book': book,
+        'description': book.description or NO_DESCRIPTION,
         'reviews': reviews,
         'form': form,
-        'average_rating': average_rating
+        # Maintained on Book by ROS_App.ratings, so no aggregate query here
+        'average_rating': book.rating_average,
+        'rating_count': book.rating_count,
+        'rating_histogram': book.rating_histogram,
+        'list_status': list_membership(request).status(book_id),
+        'related_books': related_books(book_id),
     })
 
+
+def related_books(book_id, limit=RELATED_BOOKS):
+    """The book's precomputed "more like this" list, one lookup on (book, rank)."""
+    related = RelatedBook.objects.filter(book_id=book_id).select_related('related').only(
+        'related__id', 'related__title', 'related__author', 'related__cover_image').order_by('rank')[:limit]
+    return [{
+        'id': row.related.id,
+        'title': row.related.title,
+        'author': row.related.author,
+        'cover': row.related.cover_image.name,
+    } for row in related]
+
     
 
 def tbr_list(request):
     if request.user.is_authenticated:
-        # Fetch all books in the user's TBR list
-        tbr_books = TBR.objects.filter(user=request.user)  # Fetch TBR entries for the logged-in user
-        books_in_tbr = [entry.book for entry in tbr_books]  # Get the actual Book instances from TBR
-
-        return render(request, 'ROS_App/tbr_list.html', {'books': books_in_tbr})  # Render the TBR list page
+        # One joined query for a page of the user's TBR entries and their books
+        context = saved_books_context(request, TBR)
+        return render(request, 'ROS_App/tbr_list.html', context)  # Render the TBR list page
     else:
         return redirect('login') 
 
+
+def saved_books_context(request, model):
+    """A page of the user's TBR or Skipped entries, filtered and sorted from the query string."""
+    entries = model.objects.filter(user=request.user)
+    categories = (entries.exclude(book__category__isnull=True).exclude(book__category='')
+                  .values_list('book__category', flat=True).distinct().order_by('book__category'))
+
+    category = request.GET.get('category')
+    if category:
+        entries = entries.filter(book__category=category)
+    sort = request.GET.get('sort')
+    if sort not in SAVED_BOOK_SORTS:
+        sort = 'newest'
+
+    entries = entries.select_related('book').only(
+        'id', 'added_on', 'book__id', 'book__title', 'book__author', 'book__description',
+        'book__cover_image', 'book__category')
+    page = keyset_page(entries, SAVED_BOOK_SORTS[sort], request.GET.get('after'), SAVED_BOOKS_PER_PAGE)
+    return {
+        'books': [entry.book for entry in page],
+        'page': page,
+        'categories': list(categories),
+        'category': category,
+        'sort': sort,
+        'sorts': list(SAVED_BOOK_SORTS),
+    }
+
 @login_required
 def add_to_tbr(request, book_id):
     # Ensure the request is POST and the user is authenticated
     if request.method == 'POST' and request.user.is_authenticated:
         book = get_object_or_404(Book, id=book_id)
 
-        # Check if the book is already in the TBR list
-        if not TBR.objects.filter(user=request.user, book=book).exists():
-            # Add the book to the TBR list if it's not already there
-            TBR.objects.create(user=request.user, book=book)
+        # Add the book unless it is already in the TBR list, in one statement
+        if add_to_list(TBR, request.user.id, book.id):
             return JsonResponse({'success': True})  # Respond with success
         
         # If the book is already in the TBR list, return failure
@@ -126,17 +337,89 @@ def add_to_tbr(request, book_id):
     return JsonResponse({'success': False, 'message': 'You need to be logged in to add a book to TBR.'})
 
 
+@require_POST
+def update_lists(request):
+    """
+    Applies many TBR/Skipped changes in one request. The body is JSON:
+    {"operations": [{"op": "add", "list": "tbr", "book": 1},
+                    {"op": "remove", "list": "skipped", "book": 2},
+                    {"op": "move", "from": "tbr", "to": "skipped", "book": 3}]}
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'success': False, 'message': 'You need to be logged in to change your lists.'}, status=401)
+    try:
+        operations = json.loads(request.body)['operations']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'success': False, 'message': 'Expected a JSON object with an "operations" list.'}, status=400)
+    if not isinstance(operations, list):
+        return JsonResponse({'success': False, 'message': '"operations" must be a list.'}, status=400)
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return JsonResponse(
+            {'success': False, 'message': f'At most {MAX_BATCH_OPERATIONS} operations per request.'}, status=400)
+
+    results = apply_operations(request.user.id, operations)
+    return JsonResponse({'success': all(result['success'] for result in results), 'results': results})
+
+
+def next_books(request):
+    """
+    The next books for the user to decide on, most popular first, leaving out
+    every book already on their TBR or Skipped list. The position is kept in
+    the session per category, so each call carries on from the last one and
+    the client can prefetch while the user is still deciding. Once the queue
+    runs out it starts over, bringing back any books that were left undecided.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'success': False, 'message': 'You need to be logged in to get book suggestions.'}, status=401)
+    category = request.GET.get('category') or None
+    try:
+        limit = min(max(int(request.GET.get('limit', SWIPE_BATCH_SIZE)), 1), MAX_SWIPE_BATCH_SIZE)
+    except ValueError:
+        limit = SWIPE_BATCH_SIZE
+
+    cursors = request.session.get('swipe_cursors', {})
+    key = category or ''
+    if request.GET.get('reset'):
+        cursors.pop(key, None)
+
+    books = Book.objects.exclude(
+        Exists(TBR.objects.filter(user=request.user, book=OuterRef('pk')))
+    ).exclude(
+        Exists(SkippedBooks.objects.filter(user=request.user, book=OuterRef('pk')))
+    ).only('id', 'title', 'author', 'description', 'cover_image', 'category', 'popularity_score')
+    if category:
+        books = books.filter(category=category)
+    page = keyset_page(books, SWIPE_ORDERING, cursors.get(key), limit)
+
+    # Without a next page the queue wraps around on the following call
+    if page.has_next:
+        cursors[key] = page.next_cursor
+    else:
+        cursors.pop(key, None)
+    request.session['swipe_cursors'] = cursors
+
+    return JsonResponse({
+        'books': [{
+            'id': book.id,
+            'title': book.title,
+            'author': book.author,
+            'description': book.description,
+            'category': book.category,
+            'cover': book.cover_image.name,
+            'url': reverse('book_detail', args=[book.id]),
+        } for book in page],
+        'has_more': page.has_next,
+    })
+
+
 def delete_from_tbr(request, book_id):
     # Get the book object by its ID
     book = get_object_or_404(Book, id=book_id)
     
     # Check if the user is authenticated before removing the book from TBR
     if request.user.is_authenticated:
-        # Get the TBR entry for the logged-in user and the selected book
-        tbr_entry = TBR.objects.filter(user=request.user, book=book).first()
-        
-        if tbr_entry:
-            tbr_entry.delete()  # Delete the TBR entry
+        # Delete the TBR entry for the logged-in user and the selected book
+        remove_from_list(TBR, request.user.id, book.id)
         
         # Redirect to the user's TBR list after deletion
         return redirect('tbr_list')
@@ -146,9 +429,8 @@ def delete_from_tbr(request, book_id):
 
 def SkippedBooks_list(request):
     if request.user.is_authenticated:
-        Skipped_books = SkippedBooks.objects.filter(user=request.user)  
-        books_in_Skipped = [entry.book for entry in Skipped_books]  
-        return render(request, 'ROS_App/skipped_books_list.html', {'books': books_in_Skipped})  
+        context = saved_books_context(request, SkippedBooks)
+        return render(request, 'ROS_App/skipped_books_list.html', context)  
     else:
         return redirect('login') 
     
@@ -158,10 +440,8 @@ def add_to_Skipped(request, book_id):
     if request.method == 'POST' and request.user.is_authenticated:
         book = get_object_or_404(Book, id=book_id)
 
-        # Check if the book is already in the skipped list
-        if not SkippedBooks.objects.filter(user=request.user, book=book).exists():
-            # Add the book to the skipped list if it's not already there
-            SkippedBooks.objects.create(user=request.user, book=book)
+        # Add the book unless it is already in the skipped list, in one statement
+        if add_to_list(SkippedBooks, request.user.id, book.id):
             return JsonResponse({'success': True})  # Respond with success
         
         # If the book is already in the skipped list, return failure
@@ -177,11 +457,8 @@ def delete_from_Skipped(request, book_id):
     
     # Check if the user is authenticated before removing the book from skipped book list
     if request.user.is_authenticated:
-        # Get the TBR entry for the logged-in user and the selected book
-        skippedBook_entry = SkippedBooks.objects.filter(user=request.user, book=book).first()
-        
-        if skippedBook_entry:
-            skippedBook_entry.delete()  # Delete the skipped book entry
+        # Delete the skipped book entry for the logged-in user and the selected book
+        remove_from_list(SkippedBooks, request.user.id, book.id)
         
         # Redirect to the user's skipped book list after deletion
         return redirect('skipped_book_list')
@@ -229,9 +506,37 @@ def book_review(request, review_id):
     else:
         form = ReviewForm()
 
-    reviews = Review.objects.filter(book=book).order_by('-created_at')
+    reviews = review_feed(book.id, request.GET.get('after'))
     return render(request, 'books/book_review.html', {'form': form, 'reviews': reviews, 'book': book})
 
+
+def review_feed(book_id, cursor=None):
+    """One page of a book's reviews, newest first, with their authors in the same query."""
+    reviews = (Review.objects.filter(book_id=book_id)
+               .select_related('user')
+               .only('id', 'book_id', 'review', 'summary', 'rating', 'created_at', 'user__id', 'user__username'))
+    return keyset_page(reviews, REVIEW_ORDERING, cursor, REVIEWS_PER_PAGE)
+
+
+@login_required
+def book_reviews(request, book_id):
+    """JSON for the "load more reviews" button."""
+    page = review_feed(book_id, request.GET.get('after'))
+    return JsonResponse({
+        'reviews': [{
+            'id': review.id,
+            'user': review.user.username,
+            'rating': review.rating,
+            'review': review.review,
+            'summary': review.summary,
+            'created_at': review.created_at.isoformat(),
+            'is_mine': review.user_id == request.user.id,
+            'edit_url': reverse('edit_review', args=[review.id]),
+            'delete_url': reverse('delete_review', args=[review.id]),
+        } for review in page],
+        'next': page.next_cursor,
+    })
+
 def register_view(request):
     if request.method == 'POST':
         username = request.POST.get('username')
@@ -334,70 +639,66 @@ def delete_account(request):
     return redirect('confirm_delete')
 
 
-def load_books_from_csv():
-    books = {
-        'Fantasy': [],
-        'Thriller': [],
-        'Romance': [],
-        'Classics': [],
-    }
-
-    csv_file_path = os.path.join(settings.MEDIA_ROOT, 'books.csv')
-
-    with open(csv_file_path, 'r') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            book_data = {
-                'id': row['id'],
-                'title': row['title'],
-                'author': row['author'],
-                'cover': row['cover'],
-                'description': row['description'],
-            }
-            category = row['category']
-            if category in books:
-                books[category].append(book_data)
-    
-    return books
-
-
-def fantasy_view(request):
-    books = load_books_from_csv() 
-    fantasy_books = books.get('Fantasy', []) 
-    return render(request, 'ROS_App/fantasy.html', {'fantasy_books': fantasy_books})
+def search_etag(request):
+    return page_etag(request)
 
-def thriller_view(request):
-    books = load_books_from_csv()  
-    thriller_books = books.get('Thriller', [])  
-    return render(request, 'ROS_App/thriller.html', {'thriller_books': thriller_books})
 
+def search_last_modified(request):
+    return page_last_modified(request)
 
-def romance_view(request):
-    books = load_books_from_csv() 
-    romance_books = books.get('Romance', [])  
-    return render(request, 'ROS_App/romance.html', {'romance_books': romance_books})
 
-def classics_view(request):
-    books = load_books_from_csv()
-    classics_books = books.get('Classics', [])  
-    return render(request, 'ROS_App/classics.html', {'classics_books': classics_books})
+@private_revalidate
+@condition(etag_func=search_etag, last_modified_func=search_last_modified)
 def search_books(request):
-    query = request.GET.get('q', '').strip().lower()
+    query = request.GET.get('q', '').strip()
+
+    # Ranked full-text search over title, author and description
+    results = SearchResults(query)
+    if results.count() == 1:
+        return redirect('book_detail', book_id=results[0]['id'])
+    elif results.count() > 1:
+        page = Paginator(results, SEARCH_RESULTS_PER_PAGE).get_page(request.GET.get('page'))
+        return render(request, 'ROS_App/search_results.html', {
+            'query': query,
+            'books': page,
+            'page': page,
+            'membership': list_membership(request),
+        })
+
+    # Nothing matched as typed, so try the typo-tolerant trigram index
+    suggestion, fuzzy_books = fuzzy_search(query)
+    if fuzzy_books:
+        return render(request, 'ROS_App/search_results.html', {
+            'query': query,
+            'books': fuzzy_books,
+            'suggestion': suggestion,
+            'membership': list_membership(request),
+        })
 
+    messages.info(request, f"No books found matching '{query}'")
+    return redirect('home') 
 
-    all_books_by_category = load_books_from_csv()
-    all_books = sum(all_books_by_category.values(), []) 
 
-    matching_books = [book for book in all_books if query in book['title'].lower()]
 
-    if len(matching_books) == 1:
-        return redirect('book_detail', book_id=int(matching_books[0]['id'])) 
-    elif len(matching_books) > 1:
-        return render(request, 'ROS_App/search_results.html', {'query': query, 'books': matching_books}) 
+def suggest_etag(request):
+    # Suggestions change with the catalog and, as they are ranked by
+    # popularity, with the trending scores. Both versions are persisted, so
+    # every worker (and any shared cache in front of them) agrees on the ETag.
+    stamps = version_stamps([CATALOG_VERSION, TRENDING_VERSION])
+    return f'{stamps[CATALOG_VERSION][0]}.{stamps[TRENDING_VERSION][0]}'
 
-    messages.info(request, f"No books found matching '{query}'")
-    return redirect('home') 
 
+@condition(etag_func=suggest_etag)
+def search_suggest(request):
+    query = request.GET.get('q', '')
+    try:
+        limit = int(request.GET.get('limit', 8))
+    except ValueError:
+        limit = 8
+
+    response = JsonResponse({'query': query, 'results': suggest(query, limit=max(limit, 1))})
+    patch_cache_control(response, public=True, max_age=SUGGEST_MAX_AGE)
+    return response
 
 
 def logout_view(request):
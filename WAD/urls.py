@@ -15,6 +15,8 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path
 from django.urls import include
@@ -23,3 +25,7 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path('', include('ROS_App.urls')),
 ]
+
+# Uploaded files and generated cover thumbnails; a real web server serves
+# MEDIA_ROOT directly in production
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)